@@ -1,14 +1,18 @@
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException, status, APIRouter # type: ignore
+from fastapi import Depends, HTTPException, status, APIRouter, Request # type: ignore
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials # type: ignore
 from jose import JWTError, jwt # type: ignore
-from passlib.context import CryptContext # type: ignore
 from sqlalchemy.orm import Session # type: ignore
 import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv # type: ignore
 
-import models, schemas
-from database import get_db
+import models, schemas, utils
+from database import get_db, get_db_runner, DBRunner
 
 # Cargar variables de entorno
 load_dotenv()
@@ -18,19 +22,15 @@ SECRET_KEY = os.getenv("SECRET_KEY", "mi_clave_por_defecto")
 ALGORITHM = "HS256"
 #ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-# Para manejar contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Autenticación con token tipo Bearer
 oauth2_scheme = HTTPBearer()
+optional_oauth2_scheme = HTTPBearer(auto_error=False)
 
-# Función para generar hash de una contraseña
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-# Función para verificar una contraseña contra su hash
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Endpoints internos (cron, workers, métricas): header X-Update-Token = UPDATE_SECRET
+def require_update_token(request: Request):
+    secret = os.getenv("UPDATE_SECRET")
+    if not secret or request.headers.get("X-Update-Token") != secret:
+        raise HTTPException(status_code=403, detail="No autorizado")
 
 # Crear un JWT válido con tiempo de expiración
 def create_access_token(data: dict):
@@ -47,50 +47,155 @@ def get_user_by_email(db: Session, email: str):
 # Verificar credenciales de login
 def authenticate_user(db: Session, email: str, password: str):
     user = get_user_by_email(db, email)
-    if not user or not verify_password(password, user.password_hash):
+    if not user:
+        return None
+    # bcrypt corre en el pool de utils; puede lanzar 503 si está saturado
+    valid, new_hash = utils.verify_password(password, user.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        # El hash se generó con otro costo (BCRYPT_ROUNDS cambió): se reemplaza
+        user.password_hash = new_hash
+        db.commit()
+        utils.count("rehashed")
     return user
 
-# Obtener el usuario actual autenticado usando el token JWT
-# Función para obtener el usuario autenticado desde el token
-def get_current_user(
-    token: HTTPAuthorizationCredentials = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    print("DEBUG - TOKEN RECIBIDO:", token.credentials)
-    print("DEBUG - SECRET_KEY ACTUAL:", SECRET_KEY)
-
-    credentials_exception = HTTPException(
+# Caché de usuarios autenticados: token -> snapshot del usuario.
+# En un acierto se evita decodificar el JWT y consultar la tabla users.
+# Se invalida al cambiar nombre, correo o contraseña; el TTL acota lo que
+# puede quedar viejo en otros procesos del servidor.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    name: str
+    email: str
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, name=user.name, email=user.email, created_at=user.created_at)
+
+_user_cache = OrderedDict()   # token -> (snapshot, expires_at)
+_tokens_by_user = {}          # user_id -> set de tokens
+_user_cache_lock = threading.Lock()
+user_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def _cached_user(token: str):
+    with _user_cache_lock:
+        item = _user_cache.get(token)
+        if item is None or item[1] < time.monotonic():
+            if item is not None:
+                _drop_token(token)
+            user_cache_stats["misses"] += 1
+            return None
+        _user_cache.move_to_end(token)
+        user_cache_stats["hits"] += 1
+        return item[0]
+
+def _cache_user(token: str, snapshot: UserSnapshot):
+    if AUTH_CACHE_SIZE <= 0:
+        return
+    with _user_cache_lock:
+        _user_cache[token] = (snapshot, time.monotonic() + AUTH_CACHE_TTL)
+        _user_cache.move_to_end(token)
+        _tokens_by_user.setdefault(snapshot.id, set()).add(token)
+        while len(_user_cache) > AUTH_CACHE_SIZE:
+            _drop_token(next(iter(_user_cache)))
+
+def _drop_token(token: str):
+    # Llamar con el lock tomado
+    item = _user_cache.pop(token, None)
+    if item is None:
+        return
+    tokens = _tokens_by_user.get(item[0].id)
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del _tokens_by_user[item[0].id]
+
+def invalidate_user(user_id: int):
+    with _user_cache_lock:
+        for token in list(_tokens_by_user.get(user_id, ())):
+            _drop_token(token)
+            user_cache_stats["invalidations"] += 1
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+        _tokens_by_user.clear()
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar el token",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+def _user_id_from_token(credentials: str) -> int:
     try:
         # Decodificar el token
-        payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        print("DEBUG - PAYLOAD DECODIFICADO:", payload)
+        payload = jwt.decode(credentials, SECRET_KEY, algorithms=[ALGORITHM])
 
         sub = payload.get("sub")
         if sub is None:
-            print("DEBUG - No se encontró 'sub' en el token.")
-            raise credentials_exception
+            raise _credentials_exception()
 
         try:
-            user_id = int(sub)
+            return int(sub)
         except (ValueError, TypeError):
-            print("DEBUG - El valor de 'sub' no es convertible a int:", sub)
-            raise credentials_exception
+            raise _credentials_exception()
 
-    except JWTError as e:
-        print("DEBUG - Error al decodificar el token:", str(e))
-        raise credentials_exception
+    except JWTError:
+        raise _credentials_exception()
 
+def _load_snapshot(db: Session, user_id: int):
     user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
-        print("DEBUG - Usuario no encontrado con ID:", user_id)
-        raise credentials_exception
+    return UserSnapshot.from_user(user) if user is not None else None
 
-    print("DEBUG - Usuario autenticado:", user.name)
-    return user
+# Obtener el usuario actual autenticado usando el token JWT.
+# Regresa un UserSnapshot (id, name, email, created_at), no una instancia
+# ligada a la sesión: para modificar al usuario hay que cargarlo de la BD.
+def get_current_user(
+    token: HTTPAuthorizationCredentials = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    cached = _cached_user(token.credentials)
+    if cached is not None:
+        return cached
+
+    snapshot = _load_snapshot(db, _user_id_from_token(token.credentials))
+    if snapshot is None:
+        raise _credentials_exception()
 
+    _cache_user(token.credentials, snapshot)
+    return snapshot
+
+# Igual que get_current_user, para endpoints async def: comparte el DBRunner
+# del request (FastAPI resuelve la dependencia una sola vez), así que con
+# DB_ASYNC=1 la consulta a users no pasa por el threadpool ni abre otra sesión
+async def get_current_user_async(
+    token: HTTPAuthorizationCredentials = Depends(oauth2_scheme),
+    db: DBRunner = Depends(get_db_runner)
+):
+    cached = _cached_user(token.credentials)
+    if cached is not None:
+        return cached
+
+    snapshot = await db.run(_load_snapshot, _user_id_from_token(token.credentials))
+    if snapshot is None:
+        raise _credentials_exception()
+
+    _cache_user(token.credentials, snapshot)
+    return snapshot
+
+# Para endpoints públicos con funciones extra al iniciar sesión: None sin token
+async def get_optional_user_async(
+    token: Optional[HTTPAuthorizationCredentials] = Depends(optional_oauth2_scheme),
+    db: DBRunner = Depends(get_db_runner)
+):
+    if token is None:
+        return None
+    return await get_current_user_async(token, db)
@@ -0,0 +1,54 @@
+# benchmarks/bench_auth.py
+# Latencia por request de auth.get_current_user con y sin la caché de usuarios,
+# con una carga sintética de tokens de varios usuarios.
+import random
+import statistics
+import time
+from common import bench_session, print_table
+from fastapi.security import HTTPAuthorizationCredentials # type: ignore
+
+import models
+import auth
+
+USERS = 500
+REQUESTS = 20_000
+
+
+def seed(db):
+    db.bulk_insert_mappings(models.User, [
+        {"id": u, "name": f"Usuario {u}", "email": f"u{u}@x.com", "password_hash": "x"}
+        for u in range(1, USERS + 1)
+    ])
+    db.commit()
+    return [
+        HTTPAuthorizationCredentials(scheme="Bearer", credentials=auth.create_access_token({"sub": str(u)}))
+        for u in range(1, USERS + 1)
+    ]
+
+
+def run(db, tokens, cached):
+    auth.clear_user_cache()
+    timings = []
+    for _ in range(REQUESTS):
+        token = random.choice(tokens)
+        if not cached:
+            auth.clear_user_cache()
+        start = time.perf_counter()
+        auth.get_current_user(token=token, db=db)
+        timings.append(time.perf_counter() - start)
+        db.rollback()
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.99)]
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    db = bench_session()
+    tokens = seed(db)
+
+    rows = []
+    for label, cached in (("sin caché", False), ("con caché", True)):
+        mean, p99 = run(db, tokens, cached)
+        rows.append([label, f"{mean * 1e6:.0f}", f"{p99 * 1e6:.0f}"])
+    print_table(["modo", "media (µs)", "p99 (µs)"], rows)
+    print("Estadísticas de la caché:", auth.user_cache_stats)
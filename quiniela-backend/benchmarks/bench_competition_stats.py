@@ -0,0 +1,56 @@
+# benchmarks/bench_competition_stats.py
+# Tiempo y consultas SQL de /my-competitions-with-stats según el número de
+# competencias del usuario. Que las consultas no crezcan lo verifica
+# tests/test_competition_stats.py.
+import random
+import time
+from common import bench_session, print_table
+from sqlalchemy import event # type: ignore
+
+import models
+from competitions import get_my_competitions_with_stats
+
+SIZES = [1, 5, 20, 50]
+MEMBERS_PER_COMPETITION = 50
+
+
+def seed(db, n_competitions):
+    users = MEMBERS_PER_COMPETITION
+    db.bulk_insert_mappings(models.User, [
+        {"id": u, "name": f"Usuario {u}", "email": f"u{u}@x.com", "password_hash": "x"}
+        for u in range(1, users + 1)
+    ])
+    for c in range(1, n_competitions + 1):
+        db.add(models.Competition(id=c, name=f"c{c}", code=f"code{c}", is_public=False, creator_id=1))
+        db.add(models.CompetitionLeague(competition_id=c, league_id=c, league_name=f"L{c}", league_season=2025))
+        db.bulk_insert_mappings(models.CompetitionMember, [
+            {"user_id": u, "competition_id": c} for u in range(1, users + 1)
+        ])
+        db.bulk_insert_mappings(models.PointsLedger, [
+            {"user_id": u, "league_id": c, "league_season": 2025, "league_round": "R1", "points": random.randint(0, 30)}
+            for u in range(1, users + 1)
+        ])
+    db.commit()
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    rows = []
+    for n in SIZES:
+        db = bench_session()
+        seed(db, n)
+        user = db.query(models.User).get(1)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        start = time.perf_counter()
+        result = get_my_competitions_with_stats(db=db, current_user=user)
+        elapsed = time.perf_counter() - start
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+
+        assert len(result) == n
+        rows.append([n, len(statements), f"{elapsed * 1000:.1f}"])
+        db.close()
+
+    print_table(["competencias", "consultas", "ms"], rows)
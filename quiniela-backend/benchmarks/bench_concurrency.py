@@ -0,0 +1,82 @@
+# benchmarks/bench_concurrency.py
+# Requests/seg de los endpoints de lectura con 50, 200 y 1000 clientes
+# concurrentes, contra un servidor ya levantado. Correrlo dos veces para
+# comparar el camino síncrono (threadpool) con el motor asíncrono:
+#   DB_ASYNC=0 uvicorn main:app --port 8000 &   -> python benchmarks/bench_concurrency.py
+#   DB_ASYNC=1 uvicorn main:app --port 8000 &   -> python benchmarks/bench_concurrency.py
+# BENCH_TOKEN es un JWT para los endpoints autenticados (/me, /my-predictions/...).
+# BENCH_COMPETITION_ID y BENCH_ROUND eligen la competencia del ranking y la matriz.
+# UPDATE_SECRET (el mismo del servidor) es para leer /health/db.
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from common import print_table
+
+BENCH_URL = os.getenv("BENCH_URL", "http://localhost:8000")
+BENCH_TOKEN = os.getenv("BENCH_TOKEN")
+UPDATE_SECRET = os.getenv("UPDATE_SECRET")
+COMPETITION_ID = os.getenv("BENCH_COMPETITION_ID", "1")
+LEAGUE_ROUND = os.getenv("BENCH_ROUND", "Regular Season - 1")
+SECONDS = float(os.getenv("BENCH_SECONDS", "10"))
+CONCURRENCY = [int(c) for c in os.getenv("BENCH_CONCURRENCY", "50,200,1000").split(",")]
+
+PATHS = [
+    f"/ranking/?competition_id={COMPETITION_ID}",
+    f"/round-matrix/?competition_id={COMPETITION_ID}&league_round={LEAGUE_ROUND}",
+]
+if BENCH_TOKEN:
+    PATHS += ["/me", "/my-predictions/", "/available-matches/"]
+
+
+def client(stop, timings, errors, lock, offset):
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {BENCH_TOKEN}"} if BENCH_TOKEN else {}
+    i = offset
+    while not stop.is_set():
+        path = PATHS[i % len(PATHS)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            ok = session.get(BENCH_URL + path, headers=headers, timeout=30).status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                timings.append(elapsed)
+            else:
+                errors[0] += 1
+
+
+def run(concurrency):
+    stop = threading.Event()
+    timings, errors, lock = [], [0], threading.Lock()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(client, stop, timings, errors, lock, n)
+        time.sleep(SECONDS)
+        stop.set()
+    timings.sort()
+    if not timings:
+        return [concurrency, 0, "-", "-", errors[0]]
+    return [
+        concurrency,
+        f"{len(timings) / SECONDS:.1f}",
+        f"{statistics.median(timings) * 1000:.1f}",
+        f"{timings[int(len(timings) * 0.99) - 1] * 1000:.1f}",
+        errors[0],
+    ]
+
+
+def main():
+    mode = requests.get(f"{BENCH_URL}/health/db", headers={"X-Update-Token": UPDATE_SECRET or ""}).json()["pool"].get("async")
+    print(f"Servidor con DB_ASYNC={'1' if mode else '0'}; endpoints: {', '.join(PATHS)}\n")
+    rows = [run(c) for c in CONCURRENCY]
+    print_table(["clientes", "req/s", "p50 ms", "p99 ms", "errores"], rows)
+
+
+if __name__ == "__main__":
+    main()
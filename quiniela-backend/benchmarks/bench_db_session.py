@@ -0,0 +1,65 @@
+# benchmarks/bench_db_session.py
+# Costo por request de la dependencia get_db: la versión anterior hacía un
+# SELECT 1 antes de cada request, además del pre-ping del pool.
+# La diferencia se nota contra Postgres remoto (una ida y vuelta por request):
+#   BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_db_session.py
+import statistics
+import time
+from common import bench_session, print_table
+from sqlalchemy import text # type: ignore
+
+import models
+
+REQUESTS = 2_000
+
+
+def old_get_db(SessionLocal):
+    db = SessionLocal()
+    db.execute(text("SELECT 1"))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def new_get_db(SessionLocal):
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def run(dependency, SessionLocal):
+    timings = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        for db in dependency(SessionLocal):
+            # Un request típico: una sola consulta pequeña
+            db.query(models.User.id).filter(models.User.id == 1).first()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return [
+        f"{statistics.mean(timings) * 1e6:.0f}",
+        f"{timings[len(timings) // 2] * 1e6:.0f}",
+        f"{timings[int(len(timings) * 0.99)] * 1e6:.0f}",
+    ]
+
+
+def main():
+    db = bench_session()
+    db.add(models.User(id=1, name="Ana", email="ana@x.com", password_hash="x"))
+    db.commit()
+    from sqlalchemy.orm import sessionmaker # type: ignore
+    SessionLocal = sessionmaker(bind=db.get_bind(), autoflush=False)
+    db.close()
+
+    rows = [
+        ["con SELECT 1", *run(old_get_db, SessionLocal)],
+        ["sin SELECT 1", *run(new_get_db, SessionLocal)],
+    ]
+    print_table(["get_db", "media µs", "p50 µs", "p99 µs"], rows)
+
+
+if __name__ == "__main__":
+    main()
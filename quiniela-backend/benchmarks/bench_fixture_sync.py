@@ -0,0 +1,98 @@
+# benchmarks/bench_fixture_sync.py
+# Tiempo de pared de la descarga de fixtures para N ligas: el ciclo anterior
+# (requests.get en serie, sin sesión compartida) contra football_api.
+# Usa un servidor HTTP local que simula la latencia de API-Football, así que
+# no consume cuota. Las últimas filas miden la caché en disco: vigente (sin
+# requests) y vencida con ETag (304 sin cuerpo).
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from common import print_table
+
+import football_api
+
+LEAGUES = int(os.getenv("BENCH_LEAGUES", "20"))
+LATENCY = float(os.getenv("BENCH_API_LATENCY", "0.4"))  # segundos por respuesta
+FIXTURES_PER_LEAGUE = 380
+
+
+class FakeAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = json.dumps({"errors": [], "response": [{"fixture": {"id": i}} for i in range(FIXTURES_PER_LEAGUE)]}).encode()
+    etag = '"v1"'
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serial(base_url, entries):
+    fixtures = []
+    for league_id, season in entries:
+        response = requests.get(f"{base_url}/fixtures?league={league_id}&season={season}", headers={"x-apisports-key": "x"})
+        fixtures.extend(response.json().get("response", []))
+    return fixtures
+
+
+def pooled(base_url, entries, concurrency, cache_dir=None):
+    client = football_api.FootballAPIClient(
+        api_key="x", base_url=base_url, max_concurrency=concurrency, rate_per_minute=1000, cache_dir=cache_dir
+    )
+    fixtures = []
+    for _, _, result in client.fixtures_for_leagues(entries):
+        fixtures.extend(result)
+    return fixtures, client.stats
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    entries = [(league_id, 2025) for league_id in range(1, LEAGUES + 1)]
+
+    rows = []
+    start = time.perf_counter()
+    expected = len(serial(base_url, entries))
+    baseline = time.perf_counter() - start
+    rows.append(["serie (anterior)", f"{baseline:.2f}", "1.0x", LEAGUES])
+    for concurrency in (5, 10):
+        start = time.perf_counter()
+        fixtures, stats = pooled(base_url, entries, concurrency)
+        assert len(fixtures) == expected
+        elapsed = time.perf_counter() - start
+        rows.append([f"football_api, {concurrency} en paralelo", f"{elapsed:.2f}", f"{baseline / elapsed:.1f}x", stats["requests"]])
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        pooled(base_url, entries, 5, cache_dir)  # llena la caché
+        for label, ttl in (("caché vigente", 3600), ("caché vencida + ETag (304)", 0)):
+            football_api.CACHE_TTLS["season"] = ttl
+            start = time.perf_counter()
+            fixtures, stats = pooled(base_url, entries, 5, cache_dir)
+            assert len(fixtures) == expected
+            elapsed = time.perf_counter() - start
+            rows.append([f"football_api, 5 en paralelo, {label}", f"{elapsed:.2f}", f"{baseline / elapsed:.1f}x", stats["requests"]])
+    server.shutdown()
+
+    print(f"{LEAGUES} ligas, {LATENCY * 1000:.0f} ms de latencia por respuesta\n")
+    print_table(["cliente", "segundos", "mejora", "requests"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_login_storm.py
+# Latencia de un endpoint barato (GET /) en reposo y durante una ráfaga de
+# logins concurrentes, contra un servidor ya levantado:
+#   uvicorn main:app --port 8000 &
+#   BENCH_URL=http://localhost:8000 python benchmarks/bench_login_storm.py
+# Con el pool de bcrypt acotado los logins de más reciben 503 + Retry-After
+# y el resto de la API sigue respondiendo. UPDATE_SECRET (el mismo del
+# servidor) es para leer /auth/hash-pool-stats al final.
+import os
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from common import print_table
+
+BENCH_URL = os.getenv("BENCH_URL", "http://localhost:8000")
+UPDATE_SECRET = os.getenv("UPDATE_SECRET")
+LOGIN_THREADS = int(os.getenv("BENCH_LOGIN_THREADS", "32"))
+STORM_SECONDS = float(os.getenv("BENCH_STORM_SECONDS", "10"))
+PROBES = 200
+
+
+def create_user():
+    email = f"storm-{uuid.uuid4().hex[:8]}@x.com"
+    password = "secreto123"
+    response = requests.post(f"{BENCH_URL}/users/", json={"name": "Storm", "email": email, "password": password})
+    response.raise_for_status()
+    return email, password
+
+
+def probe_latencies(stop=None):
+    session = requests.Session()
+    timings = []
+    while len(timings) < PROBES and not (stop and stop.is_set()):
+        start = time.perf_counter()
+        session.get(f"{BENCH_URL}/")
+        timings.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    return timings
+
+
+def login_storm(email, password, stop, counts, lock):
+    session = requests.Session()
+    while not stop.is_set():
+        response = session.post(f"{BENCH_URL}/login", data={"username": email, "password": password})
+        with lock:
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+def summarize(label, timings):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    return [label, len(timings), f"{statistics.mean(timings) * 1000:.1f}", f"{p99 * 1000:.1f}"]
+
+
+def main():
+    email, password = create_user()
+    rows = [summarize("reposo", probe_latencies())]
+
+    stop = threading.Event()
+    counts, lock = {}, threading.Lock()
+    with ThreadPoolExecutor(max_workers=LOGIN_THREADS + 1) as pool:
+        for _ in range(LOGIN_THREADS):
+            pool.submit(login_storm, email, password, stop, counts, lock)
+        started = time.perf_counter()
+        probes = pool.submit(probe_latencies, stop)
+        time.sleep(STORM_SECONDS)
+        stop.set()
+        elapsed = time.perf_counter() - started
+        rows.append(summarize(f"{LOGIN_THREADS} hilos de login", probes.result()))
+
+    print_table(["escenario", "requests GET /", "media ms", "p99 ms"], rows)
+    ok = counts.get(200, 0)
+    print(f"\nLogins: {ok} exitosos ({ok / elapsed:.1f}/s), {counts.get(503, 0)} rechazados con 503, "
+          f"otros: { {k: v for k, v in counts.items() if k not in (200, 503)} }")
+    print(requests.get(f"{BENCH_URL}/auth/hash-pool-stats", headers={"X-Update-Token": UPDATE_SECRET or ""}).json())
+
+
+if __name__ == "__main__":
+    main()
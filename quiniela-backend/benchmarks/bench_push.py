@@ -0,0 +1,110 @@
+# benchmarks/bench_push.py
+# Throughput de envío de notificaciones push: el ciclo anterior (webpush()
+# en serie, conexión nueva y firma VAPID por mensaje) contra PushDispatcher.
+# Un servidor local simula el servicio push (latencia configurable) y responde
+# 410 para una fracción de suscripciones, que el dispatcher debe eliminar.
+import base64
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from common import bench_session, print_table
+from cryptography.hazmat.primitives import serialization # type: ignore
+from cryptography.hazmat.primitives.asymmetric import ec # type: ignore
+from py_vapid import Vapid, b64urlencode # type: ignore
+from pywebpush import webpush, WebPushException # type: ignore
+
+import models
+import push_notifications
+
+RECIPIENTS = int(os.getenv("BENCH_PUSH_RECIPIENTS", "1000"))
+LATENCY = float(os.getenv("BENCH_PUSH_LATENCY", "0.05"))
+GONE_EVERY = 20  # 5 % de suscripciones vencidas
+
+
+class FakePushService(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(LATENCY)
+        self.send_response(410 if "/gone/" in self.path else 201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def make_messages(db, base_url):
+    user_key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    db.add(models.User(id=1, name="Ana", email="ana@x.com", password_hash="x"))
+    messages = []
+    for i in range(RECIPIENTS):
+        path = "gone" if i % GONE_EVERY == 0 else "ok"
+        sub = models.PushSubscription(
+            id=i + 1, user_id=1, endpoint=f"{base_url}/{path}/{i}",
+            p256dh_key=b64(user_key), auth_key=b64(os.urandom(16))
+        )
+        db.add(sub)
+        messages.append({
+            "subscription_id": sub.id, "endpoint": sub.endpoint,
+            "p256dh_key": sub.p256dh_key, "auth_key": sub.auth_key,
+            "title": "⚽ A vs B", "body": "⏰ El partido empieza mañana",
+        })
+    db.commit()
+    return messages
+
+
+def serial(messages, vapid_key):
+    for message in messages:
+        try:
+            webpush(
+                subscription_info={"endpoint": message["endpoint"],
+                                   "keys": {"p256dh": message["p256dh_key"], "auth": message["auth_key"]}},
+                data='{"title": "x", "body": "y"}',
+                vapid_private_key=vapid_key,
+                vapid_claims={"sub": "mailto:admin@tu-app.com"},
+            )
+        except WebPushException:
+            pass
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePushService)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    vapid = Vapid()
+    vapid.generate_keys()
+    vapid_key = b64urlencode(vapid.private_key.private_numbers().private_value.to_bytes(32, "big"))
+
+    db = bench_session()
+    messages = make_messages(db, base_url)
+
+    start = time.perf_counter()
+    serial(messages, vapid_key)
+    baseline = time.perf_counter() - start
+
+    dispatcher = push_notifications.PushDispatcher(vapid_private_key=vapid_key)
+    metrics = dispatcher.dispatch(db, messages)
+    remaining = db.query(models.PushSubscription).count()
+    server.shutdown()
+
+    print(f"\n{RECIPIENTS} destinatarios, {LATENCY * 1000:.0f} ms por push, {dispatcher.max_workers} hilos\n")
+    print_table(["envío", "segundos", "push/s"], [
+        ["webpush() en serie", f"{baseline:.2f}", f"{RECIPIENTS / baseline:.1f}"],
+        ["PushDispatcher", f"{metrics['seconds']:.2f}", f"{metrics['per_second']}"],
+    ])
+    print(f"\nMétricas: {metrics}")
+    print(f"Suscripciones restantes: {remaining} (de {RECIPIENTS})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_round_matrix.py
+# Compara tamaño de respuesta y latencia de /round-matrix/ en formato "rows"
+# (el original) contra format=columnar
+import json
+import random
+import statistics
+import time
+from datetime import datetime
+from common import bench_session, print_table
+
+import models
+import main
+
+SIZES = [100, 1_000, 10_000]
+MATCHES_PER_ROUND = 10
+REPEAT = 5
+
+
+def seed(db, n_users):
+    db.add(models.Competition(id=1, name="c", code="c", is_public=True, creator_id=1))
+    db.add(models.CompetitionLeague(competition_id=1, league_id=1, league_name="L", league_season=2025))
+    for i in range(1, MATCHES_PER_ROUND + 1):
+        db.add(models.Match(
+            id=i, home_team=f"Local {i}", away_team=f"Visita {i}", match_date=datetime(2025, 1, 1, 18),
+            score_home=1, score_away=0, league_id=1, league_season=2025, league_round="R1",
+            home_team_logo="https://media.api-sports.io/football/teams/1.png",
+            away_team_logo="https://media.api-sports.io/football/teams/2.png",
+            status_long="Match Finished", status_short="FT", status_elapsed=90
+        ))
+    db.bulk_insert_mappings(models.User, [
+        {"id": u, "name": f"Usuario {u}", "email": f"u{u}@x.com", "password_hash": "x"}
+        for u in range(1, n_users + 1)
+    ])
+    db.bulk_insert_mappings(models.CompetitionMember, [
+        {"user_id": u, "competition_id": 1} for u in range(1, n_users + 1)
+    ])
+    db.bulk_insert_mappings(models.Prediction, [
+        {"user_id": u, "match_id": m, "pred_home": 1, "pred_away": 0, "points": random.choice([0, 1, 3])}
+        for u in range(1, n_users + 1)
+        for m in range(1, MATCHES_PER_ROUND + 1)
+        if random.random() < 0.8
+    ])
+    db.bulk_insert_mappings(models.PointsLedger, [
+        {"user_id": u, "league_id": 1, "league_season": 2025, "league_round": "R1", "points": 0}
+        for u in range(1, n_users + 1)
+    ])
+    db.commit()
+
+
+def measure(db, fmt):
+    # El endpoint es async y recibe un DBRunner; se llama directo a la función
+    # que arma la respuesta para medir solo consulta + serialización
+    build = main.build_round_matrix_columnar if fmt == "columnar" else main.build_round_matrix
+    timings, body = [], b""
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        payload = build(db, 1, "R1")
+        body = json.dumps(payload, default=str, separators=(",", ":")).encode()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(body)
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    rows = []
+    for n in SIZES:
+        db = bench_session()
+        seed(db, n)
+        rows_time, rows_bytes = measure(db, "rows")
+        col_time, col_bytes = measure(db, "columnar")
+        rows.append([
+            n,
+            f"{rows_bytes / 1024:.0f}", f"{col_bytes / 1024:.0f}",
+            f"{rows_time * 1000:.1f}", f"{col_time * 1000:.1f}",
+        ])
+        db.close()
+
+    print_table(["usuarios", "rows (KB)", "columnar (KB)", "rows (ms)", "columnar (ms)"], rows)
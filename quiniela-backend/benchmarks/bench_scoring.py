@@ -0,0 +1,76 @@
+# benchmarks/bench_scoring.py
+# Compara el ciclo ORM original de update_match_result contra el UPDATE de scoring.py
+import random
+from common import bench_session, timed, print_table
+
+import models
+import scoring
+
+SIZES = [1_000, 10_000, 100_000]
+SCORE_HOME, SCORE_AWAY = 2, 1
+
+
+def make_rows(n):
+    return [
+        {
+            "id": i,
+            "user_id": i,
+            "match_id": 1,
+            "pred_home": random.randint(0, 4),
+            "pred_away": random.randint(0, 4),
+            "points": 0
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def seed(db, rows):
+    db.query(models.Prediction).delete()
+    db.query(models.Match).delete()
+    db.add(models.Match(id=1, home_team="A", away_team="B", score_home=SCORE_HOME, score_away=SCORE_AWAY))
+    db.bulk_insert_mappings(models.Prediction, rows)
+    db.commit()
+
+
+def legacy_loop(db):
+    # Copia del ciclo anterior de main.update_match_result
+    predictions = db.query(models.Prediction).filter_by(match_id=1).all()
+    for pred in predictions:
+        pred.points = scoring.points_for(pred.pred_home, pred.pred_away, SCORE_HOME, SCORE_AWAY)
+    db.commit()
+    return len(predictions)
+
+
+def set_based(db):
+    updated = scoring.score_match(db, 1)
+    db.commit()
+    return updated
+
+
+def snapshot(db):
+    return dict(db.query(models.Prediction.id, models.Prediction.points).all())
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    db = bench_session()
+    rows = []
+    for n in SIZES:
+        times = {}
+        data = make_rows(n)
+        seed(db, data)
+        with timed("loop", times):
+            legacy_loop(db)
+        expected = snapshot(db)
+
+        seed(db, data)
+        db.expire_all()
+        with timed("update", times):
+            updated = set_based(db)
+        assert updated == n, updated
+        assert snapshot(db) == expected, "los puntos no coinciden con el ciclo original"
+
+        rows.append([n, f"{times['loop'] * 1000:.1f}", f"{times['update'] * 1000:.1f}",
+                     f"{times['loop'] / times['update']:.1f}x"])
+
+    print_table(["predicciones", "ciclo ORM (ms)", "UPDATE (ms)", "mejora"], rows)
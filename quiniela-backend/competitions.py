@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException # type: ignore
 from sqlalchemy.orm import Session # type: ignore
-from sqlalchemy import func # type: ignore
+from sqlalchemy import func, select # type: ignore
 from database import get_db
 from models import Competition, CompetitionLeague, CompetitionMember, User
 import models
@@ -9,6 +9,9 @@ from pydantic import BaseModel # type: ignore
 import random
 import string
 from auth import get_current_user
+from response_cache import (
+    cache, competition_tag, COMPETITION_LEAGUES_TAG, PUBLIC_COMPETITIONS_TAG
+)
 from datetime import datetime
 
 router = APIRouter()
@@ -44,6 +47,40 @@ def generate_unique_code(db: Session, length: int = 8):
         if not exists:
             return code
 
+def user_competitions_tag(user_id: int):
+    return f"user:{user_id}:competitions"
+
+def get_league_filters(db: Session, competition_id: int):
+    # [(league_id, league_season)] de la competencia; cacheado porque casi todos
+    # los endpoints por competencia lo consultan y solo cambia al borrarla
+    def load():
+        rows = db.query(CompetitionLeague.league_id, CompetitionLeague.league_season).filter(
+            CompetitionLeague.competition_id == competition_id
+        ).all()
+        return [(row.league_id, row.league_season) for row in rows]
+
+    return cache.get_or_set(
+        "league_filters", competition_id, load,
+        ttl=3600, tags=[competition_tag(competition_id)]
+    )
+
+def get_user_league_filters(db: Session, user_id: int):
+    # [(league_id, league_season)] de todas las competencias del usuario
+    key = ("user", user_id)
+    filters = cache.get("league_filters", key)
+    if filters is None:
+        generation = cache.generation()
+        rows = (
+            db.query(CompetitionLeague.competition_id, CompetitionLeague.league_id, CompetitionLeague.league_season)
+            .join(CompetitionMember, CompetitionMember.competition_id == CompetitionLeague.competition_id)
+            .filter(CompetitionMember.user_id == user_id)
+            .all()
+        )
+        filters = list(dict.fromkeys((row.league_id, row.league_season) for row in rows))
+        tags = [user_competitions_tag(user_id)] + [competition_tag(row.competition_id) for row in rows]
+        cache.set("league_filters", key, filters, ttl=3600, tags=tags, generation=generation)
+    return filters
+
 # ----------- ENDPOINTS -----------
 
 @router.post("/competitions/", response_model=CompetitionOut)
@@ -74,6 +111,7 @@ def create_competition(data: CompetitionCreate, db: Session = Depends(get_db), c
     db.add(member)
 
     db.commit()
+    cache.invalidate_tags(COMPETITION_LEAGUES_TAG, PUBLIC_COMPETITIONS_TAG, user_competitions_tag(current_user.id))
     return comp
 
 @router.post("/competitions/join/{code}")
@@ -92,6 +130,7 @@ def join_competition(code: str, db: Session = Depends(get_db), current_user: Use
     member = CompetitionMember(user_id=current_user.id, competition_id=comp.id)
     db.add(member)
     db.commit()
+    cache.invalidate_tags(competition_tag(comp.id), user_competitions_tag(current_user.id))
     return {"message": "Joined successfully"}
 
 @router.get("/competitions/my", response_model=List[CompetitionOut])
@@ -109,52 +148,82 @@ def get_my_competitions_with_stats(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    competitions = (
-        db.query(Competition)
-        .join(CompetitionMember, Competition.id == CompetitionMember.competition_id)
+    # Tres consultas sin importar en cuántas competencias esté el usuario
+    my_competition_ids = (
+        db.query(CompetitionMember.competition_id)
         .filter(CompetitionMember.user_id == current_user.id)
-        .all()
+        .subquery()
     )
+    in_my_competitions = CompetitionMember.competition_id.in_(select(my_competition_ids.c.competition_id))
 
-    result = []
-
-    for comp in competitions:
-        members = (
-            db.query(
-                User.id.label("user_id"),
-                User.name,
-                func.coalesce(func.sum(models.Prediction.points), 0).label("total_points")
-            )
-            .join(CompetitionMember, User.id == CompetitionMember.user_id)
-            .outerjoin(models.Prediction, User.id == models.Prediction.user_id)
-            .outerjoin(models.Match, models.Prediction.match_id == models.Match.id)
-            .join(models.CompetitionLeague, (models.Match.league_id == models.CompetitionLeague.league_id) &
-                                          (models.Match.league_season == models.CompetitionLeague.league_season))
-            .filter(CompetitionMember.competition_id == comp.id)
-            .filter(models.CompetitionLeague.competition_id == comp.id)
-            .group_by(User.id)
-            .order_by(func.coalesce(func.sum(models.Prediction.points), 0).desc())
-            .all()
-        )
-
-        user_ranking = next(
-            (i + 1 for i, m in enumerate(members) if m.user_id == current_user.id),
-            None
+    # 1. Competencias con su número de miembros
+    member_counts = (
+        db.query(
+            CompetitionMember.competition_id,
+            func.count(func.distinct(CompetitionMember.user_id)).label("member_count")
         )
+        .filter(in_my_competitions)
+        .group_by(CompetitionMember.competition_id)
+        .subquery()
+    )
+    competitions = (
+        db.query(Competition, member_counts.c.member_count)
+        .join(member_counts, member_counts.c.competition_id == Competition.id)
+        .order_by(Competition.id)
+        .all()
+    )
 
-        leagues = db.query(CompetitionLeague).filter(CompetitionLeague.competition_id == comp.id).all()
+    # 2. Ligas de todas esas competencias
+    leagues_by_comp = {}
+    leagues = (
+        db.query(CompetitionLeague)
+        .filter(CompetitionLeague.competition_id.in_(select(my_competition_ids.c.competition_id)))
+        .all()
+    )
+    for l in leagues:
+        leagues_by_comp.setdefault(l.competition_id, []).append(l)
 
-        member_count = db.query(CompetitionMember).filter(CompetitionMember.competition_id == comp.id).count()
+    # 3. Puntos y posición del usuario en cada competencia (RANK() por competencia)
+    totals = (
+        db.query(
+            CompetitionMember.competition_id,
+            CompetitionMember.user_id,
+            func.sum(models.PointsLedger.points).label("total_points")
+        )
+        .join(CompetitionLeague, CompetitionLeague.competition_id == CompetitionMember.competition_id)
+        .join(models.PointsLedger, (models.PointsLedger.user_id == CompetitionMember.user_id) &
+                                   (models.PointsLedger.league_id == CompetitionLeague.league_id) &
+                                   (models.PointsLedger.league_season == CompetitionLeague.league_season))
+        .filter(in_my_competitions)
+        .group_by(CompetitionMember.competition_id, CompetitionMember.user_id)
+        .subquery()
+    )
+    ranked = db.query(
+        totals.c.competition_id,
+        totals.c.user_id,
+        totals.c.total_points,
+        func.rank().over(
+            partition_by=totals.c.competition_id,
+            order_by=totals.c.total_points.desc()
+        ).label("position")
+    ).subquery()
+    my_stats = {
+        row.competition_id: row
+        for row in db.query(ranked).filter(ranked.c.user_id == current_user.id)
+    }
 
+    result = []
+    for comp, member_count in competitions:
+        stats = my_stats.get(comp.id)
         result.append({
             "id": comp.id,
             "name": comp.name,
             "is_public": comp.is_public,
             "invite_code": comp.code,
             "member_count": member_count,
-            "my_ranking": user_ranking,
-            "my_points": next((m.total_points for m in members if m.user_id == current_user.id), 0),
-            "leagues": [{"league_name": l.league_name, "league_logo": l.league_logo} for l in leagues],
+            "my_ranking": stats.position if stats else None,
+            "my_points": stats.total_points if stats else 0,
+            "leagues": [{"league_name": l.league_name, "league_logo": l.league_logo} for l in leagues_by_comp.get(comp.id, [])],
             "is_creator": comp.creator_id == current_user.id
         })
 
@@ -177,11 +246,18 @@ def delete_competition(
 
     db.delete(comp)
     db.commit()
+    cache.invalidate_tags(competition_tag(competition_id), COMPETITION_LEAGUES_TAG, PUBLIC_COMPETITIONS_TAG)
 
     return {"message": "🗑️ Competencia eliminada correctamente"}
 
 @router.get("/competitions/leagues")
 def get_all_competition_leagues(db: Session = Depends(get_db)):
+    return cache.get_or_set(
+        "competitions_leagues", None, lambda: load_all_competition_leagues(db),
+        ttl=3600, tags=[COMPETITION_LEAGUES_TAG]
+    )
+
+def load_all_competition_leagues(db: Session):
     leagues = (
         db.query(
             CompetitionLeague.league_id,
@@ -202,8 +278,15 @@ def get_all_competition_leagues(db: Session = Depends(get_db)):
         }
         for l in leagues
     ]
+
 @router.get("/competitions/public")
 def get_public_competitions(db: Session = Depends(get_db)):
+    return cache.get_or_set(
+        "competitions_public", None, lambda: load_public_competitions(db),
+        ttl=600, tags=[PUBLIC_COMPETITIONS_TAG]
+    )
+
+def load_public_competitions(db: Session):
     competitions = db.query(Competition).filter(Competition.is_public == True).all()
     result = []
 
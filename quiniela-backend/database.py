@@ -1,31 +1,225 @@
-from sqlalchemy import create_engine # type: ignore
+from sqlalchemy import create_engine, event, text # type: ignore
 from sqlalchemy.orm import sessionmaker, declarative_base # type: ignore
+from sqlalchemy.pool import NullPool, QueuePool # type: ignore
+from sqlalchemy import exc as sa_exc # type: ignore
+from sqlalchemy.engine import make_url # type: ignore
+from abc import ABC, abstractmethod
 import os
+import threading
+import time
 from dotenv import load_dotenv # type: ignore
+from starlette.concurrency import run_in_threadpool # type: ignore
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"sslmode": "require"},  # obligatorio para Neon
-    pool_pre_ping=True
-)
+# Configuración del pool de conexiones
+# DB_POOL_MODE=queue  -> pool propio de SQLAlchemy (conexión directa a Postgres)
+# DB_POOL_MODE=null   -> sin pool local, para poolers en modo transacción
+#                        (PgBouncer, endpoint "-pooler" de Neon)
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = sin límite
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+IS_POSTGRES = DATABASE_URL.startswith("postgres")
+
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool que mide cuánto espera cada checkout por una conexión libre
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            with self._wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def engine_options():
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    connect_args = {}
+    if IS_POSTGRES:
+        # sslmode es obligatorio para Neon; SQLite (benchmarks locales) no lo acepta
+        connect_args["sslmode"] = DB_SSLMODE
+        if DB_STATEMENT_TIMEOUT_MS and DB_POOL_MODE != "null":
+            # Los poolers en modo transacción rechazan parámetros de arranque;
+            # en ese modo el timeout se aplica con SET LOCAL (ver abajo)
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+        if DB_POOL_MODE == "null":
+            options["poolclass"] = NullPool
+        else:
+            options.update(
+                poolclass=InstrumentedQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+            )
+    options["connect_args"] = connect_args
+    return options
+
+
+engine = create_engine(DATABASE_URL, **engine_options())
+
+if IS_POSTGRES and DB_STATEMENT_TIMEOUT_MS and DB_POOL_MODE == "null":
+    @event.listens_for(engine, "begin")
+    def _set_statement_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False)
 Base = declarative_base()
 
-# Función para obtener una sesión de base de datos
+# INSERT con soporte de ON CONFLICT según el motor (Postgres en producción, SQLite local)
+def dialect_insert(db, model):
+    if db.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert # type: ignore
+    else:
+        from sqlalchemy.dialects.postgresql import insert # type: ignore
+    return insert(model)
+
+# Función para obtener una sesión de base de datos.
+# No se hace SELECT 1 por request: pool_pre_ping ya valida la conexión al
+# sacarla del pool y la sesión nueva no puede tener un rollback pendiente.
 def get_db():
     db = SessionLocal()
-    from sqlalchemy import text # type: ignore
-    from sqlalchemy.exc import PendingRollbackError # type: ignore
-
-    try:
-        db.execute(text("SELECT 1"))
-    except PendingRollbackError:
-        print("[DB] Rollback pendiente detectado")
-        db.rollback()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def pool_stats():
+    stats = {
+        "mode": DB_POOL_MODE if IS_POSTGRES else engine.dialect.name,
+        "pre_ping": DB_POOL_PRE_PING,
+        "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS or None,
+        "async": DB_ASYNC,
+        **queue_pool_stats(engine.pool),
+    }
+    if async_engine is not None:
+        stats["async_pool"] = queue_pool_stats(async_engine.pool)
+    return stats
+
+def queue_pool_stats(pool):
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._wait_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                wait_avg_ms=round(pool.wait_total / pool.checkouts * 1000, 3) if pool.checkouts else None,
+                wait_max_ms=round(pool.wait_max * 1000, 3),
+                timeouts=pool.timeouts,
+            )
+    return stats
+
+# Motor asíncrono (DB_ASYNC=1): los endpoints de lectura más usados esperan a
+# la base sin ocupar un hilo del threadpool. Postgres usa asyncpg y SQLite
+# aiosqlite. Con DB_ASYNC=0 esos mismos endpoints corren la consulta en el
+# threadpool con la sesión síncrona de siempre.
+def async_database_url(url):
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        # asyncpg no acepta los parámetros de libpq en la URL; ssl va en connect_args
+        return url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode", "channel_binding"])
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+def async_engine_options():
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    connect_args = {}
+    if IS_POSTGRES:
+        connect_args["ssl"] = DB_SSLMODE
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        if DB_POOL_MODE == "null":
+            # PgBouncer en modo transacción no soporta sentencias preparadas con nombre
+            connect_args["statement_cache_size"] = 0
+            options["poolclass"] = NullPool
+        else:
+            options.update(
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+            )
+    options["connect_args"] = connect_args
+    return options
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker # type: ignore
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **async_engine_options())
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+class DBRunner(ABC):
+    # Ejecuta funciones escritas para una Session normal: fn(db, *args)
+    def __init__(self, session):
+        self.session = session
+
+    @abstractmethod
+    async def run(self, fn, *args, **kwargs):
+        ...
+
+
+class AsyncDBRunner(DBRunner):
+    # Sobre una AsyncSession (run_sync): el código de consultas es el mismo
+    # y la espera de I/O no bloquea el loop
+    async def run(self, fn, *args, **kwargs):
+        return await self.session.run_sync(fn, *args, **kwargs)
+
+
+class ThreadpoolDBRunner(DBRunner):
+    # Modo síncrono: la misma función corre en el threadpool con una Session normal
+    async def run(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+# Dependencia para endpoints async def: `await db.run(funcion, *args)`
+async def get_db_runner():
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as session:
+            yield AsyncDBRunner(session)
+    else:
+        db = SessionLocal()
+        try:
+            yield ThreadpoolDBRunner(db)
+        finally:
+            await run_in_threadpool(db.close)
+
+def check_db():
+    # Ida y vuelta real a la base, solo para /health/db
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return round((time.perf_counter() - start) * 1000, 3)
@@ -0,0 +1,349 @@
+# football_api.py
+# Cliente de API-Football compartido por los scripts de sincronización.
+# - una sesión HTTP con keep-alive y pool de conexiones
+# - concurrencia acotada (FOOTBALL_API_MAX_CONCURRENCY) al pedir varias ligas
+# - limitador de ritmo por minuto según el plan contratado
+# - timeouts y reintentos con backoff exponencial en errores transitorios
+# - caché en disco con TTL por tipo de consulta y peticiones condicionales
+#   (If-None-Match / If-Modified-Since) cuando la API manda ETag o Last-Modified
+# - FOOTBALL_API_CACHE_ONLY=1 repite los últimos datos guardados sin llamar a
+#   la API (para cuando está caída o se agotó la cuota)
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv # type: ignore
+
+load_dotenv()
+FOOTBALL_API_KEY = os.getenv("FOOTBALL_API_KEY")
+FOOTBALL_API_BASE_URL = os.getenv("FOOTBALL_API_BASE_URL", "https://v3.football.api-sports.io")
+FOOTBALL_API_MAX_CONCURRENCY = int(os.getenv("FOOTBALL_API_MAX_CONCURRENCY", "5"))
+FOOTBALL_API_RATE_PER_MINUTE = int(os.getenv("FOOTBALL_API_RATE_PER_MINUTE", "30"))
+FOOTBALL_API_CONNECT_TIMEOUT = float(os.getenv("FOOTBALL_API_CONNECT_TIMEOUT", "5"))
+FOOTBALL_API_READ_TIMEOUT = float(os.getenv("FOOTBALL_API_READ_TIMEOUT", "30"))
+FOOTBALL_API_RETRIES = int(os.getenv("FOOTBALL_API_RETRIES", "3"))
+FOOTBALL_API_BACKOFF = float(os.getenv("FOOTBALL_API_BACKOFF", "1.0"))
+# Relativo a este archivo, no al directorio desde donde se lanza el proceso; vacío = sin caché
+FOOTBALL_API_CACHE_DIR = os.getenv("FOOTBALL_API_CACHE_DIR", ".cache/football_api")
+if FOOTBALL_API_CACHE_DIR:
+    FOOTBALL_API_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), FOOTBALL_API_CACHE_DIR)
+FOOTBALL_API_CACHE_ONLY = os.getenv("FOOTBALL_API_CACHE_ONLY", "0") == "1"
+
+# Segundos que una respuesta guardada se usa sin volver a preguntar, por tipo de consulta
+CACHE_TTLS = {
+    "live": int(os.getenv("FOOTBALL_API_CACHE_TTL_LIVE", "15")),        # fixtures?live=
+    "ids": int(os.getenv("FOOTBALL_API_CACHE_TTL_IDS", "30")),          # fixtures?ids=
+    "window": int(os.getenv("FOOTBALL_API_CACHE_TTL_WINDOW", "300")),   # fixtures con from/to
+    "season": int(os.getenv("FOOTBALL_API_CACHE_TTL_SEASON", "3600")),  # temporada completa
+    "default": int(os.getenv("FOOTBALL_API_CACHE_TTL_DEFAULT", "86400")),
+}
+# Archivos sin reescribir en este tiempo se borran (ventanas from/to viejas, bloques ids=...)
+FOOTBALL_API_CACHE_RETENTION = int(os.getenv("FOOTBALL_API_CACHE_RETENTION", str(max(CACHE_TTLS.values()))))
+CACHE_PRUNE_INTERVAL = 3600
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+FIXTURE_IDS_PER_REQUEST = 20  # máximo que acepta /fixtures?ids=
+
+
+class FootballAPIError(Exception):
+    pass
+
+
+class RateLimiter:
+    # Ventana deslizante de 60 s: como máximo `per_minute` requests por ventana
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._sent = deque()
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= 60:
+                    self._sent.popleft()
+                wait = self._paused_until - now
+                if wait <= 0 and len(self._sent) < self.per_minute:
+                    self._sent.append(now)
+                    return
+                if wait <= 0:
+                    wait = 60 - (now - self._sent[0])
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # La API avisó que no quedan requests en este minuto
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def cache_kind(endpoint, params):
+    params = params or {}
+    if endpoint != "fixtures":
+        return "default"
+    if "live" in params:
+        return "live"
+    if "ids" in params or "id" in params:
+        return "ids"
+    if "from" in params or "date" in params:
+        return "window"
+    return "season"
+
+
+class DiskCache:
+    # Un archivo JSON por (endpoint, parámetros) con la respuesta y sus validadores
+    def __init__(self, directory, ttls=CACHE_TTLS, retention=FOOTBALL_API_CACHE_RETENTION):
+        self.directory = directory
+        self.ttls = ttls
+        self.retention = retention
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, endpoint, params):
+        key = json.dumps([endpoint, sorted((str(k), str(v)) for k, v in (params or {}).items())])
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{endpoint.replace('/', '_')}-{digest}.json")
+
+    def load(self, endpoint, params):
+        try:
+            with open(self.path(endpoint, params), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, entry, endpoint, params):
+        return time.time() - entry["stored_at"] < self.ttls[cache_kind(endpoint, params)]
+
+    def prune(self):
+        # Borra las respuestas que nadie ha vuelto a guardar en `retention` segundos.
+        # Solo corre al guardar: en modo solo caché o con la API caída no se
+        # borra nada y los últimos datos siguen disponibles.
+        cutoff = time.time() - self.retention
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def _maybe_prune(self):
+        with self._prune_lock:
+            if time.monotonic() - self._last_prune < CACHE_PRUNE_INTERVAL and self._last_prune:
+                return
+            self._last_prune = time.monotonic()
+        removed = self.prune()
+        if removed:
+            print(f"🧹 Caché de API-Football: {removed} respuestas viejas borradas")
+
+    def store(self, endpoint, params, response, etag=None, last_modified=None):
+        self._maybe_prune()
+        entry = {
+            "stored_at": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+            "response": response,
+        }
+        # Escritura atómica: otro hilo o proceso nunca lee un archivo a medias
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.path(endpoint, params))
+        except OSError as e:
+            print("⚠️ No se pudo guardar la respuesta en caché:", e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return entry
+
+
+class FootballAPIClient:
+    def __init__(self, api_key=FOOTBALL_API_KEY, base_url=FOOTBALL_API_BASE_URL,
+                 max_concurrency=FOOTBALL_API_MAX_CONCURRENCY, rate_per_minute=FOOTBALL_API_RATE_PER_MINUTE,
+                 retries=FOOTBALL_API_RETRIES, backoff=FOOTBALL_API_BACKOFF,
+                 cache_dir=FOOTBALL_API_CACHE_DIR, cache_only=FOOTBALL_API_CACHE_ONLY):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = (FOOTBALL_API_CONNECT_TIMEOUT, FOOTBALL_API_READ_TIMEOUT)
+        self.limiter = RateLimiter(rate_per_minute)
+        self.session = requests.Session()
+        self.session.headers.update({"x-apisports-key": api_key or ""})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._stats_lock = threading.Lock()
+        self.cache = DiskCache(cache_dir) if cache_dir else None
+        self.cache_only = cache_only
+        # quota_saved: requests que no se hicieron porque la respuesta guardada seguía vigente
+        self.stats = {
+            "requests": 0, "retries": 0, "errors": 0,
+            "cache_hits": 0, "cache_misses": 0, "not_modified": 0, "quota_saved": 0,
+        }
+
+    def _count(self, stat, call_stats=None):
+        # call_stats: contador propio de quien hizo la llamada; self.stats es
+        # compartido por todo el proceso y lo mueven otras peticiones a la vez
+        with self._stats_lock:
+            self.stats[stat] += 1
+            if call_stats is not None:
+                call_stats[stat] = call_stats.get(stat, 0) + 1
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        self._count("retries")
+        time.sleep(delay)
+
+    def snapshot(self):
+        with self._stats_lock:
+            return {**self.stats, "cache_enabled": self.cache is not None, "cache_only": self.cache_only}
+
+    def get(self, endpoint, params=None, refresh=False, call_stats=None):
+        # Regresa la lista "response" de API-Football; lanza FootballAPIError si falla.
+        # refresh=True ignora la respuesta vigente en caché (se revalida igual con ETag)
+        entry = self.cache.load(endpoint, params) if self.cache else None
+        if self.cache_only:
+            if entry is None:
+                self._count("cache_misses", call_stats)
+                raise FootballAPIError(f"Sin datos en caché para {endpoint} {params} (modo solo caché)")
+            self._count("cache_hits", call_stats)
+            self._count("quota_saved", call_stats)
+            return entry["response"]
+        if entry is not None and not refresh and self.cache.is_fresh(entry, endpoint, params):
+            self._count("cache_hits", call_stats)
+            self._count("quota_saved", call_stats)
+            return entry["response"]
+        if self.cache:
+            self._count("cache_misses", call_stats)
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        url = f"{self.base_url}/{endpoint}"
+        last_error = None
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            self._count("requests", call_stats)
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                if attempt < self.retries:
+                    self._sleep_before_retry(attempt)
+                continue
+
+            remaining = response.headers.get("X-RateLimit-Remaining")
+            if remaining is not None and remaining.isdigit() and int(remaining) == 0:
+                self.limiter.pause(60)
+
+            if response.status_code == 304 and entry is not None:
+                # Sin cambios desde la última respuesta: no se vuelve a bajar el JSON
+                self._count("not_modified", call_stats)
+                self.cache.store(endpoint, params, entry["response"], entry.get("etag"), entry.get("last_modified"))
+                return entry["response"]
+
+            if response.status_code in RETRY_STATUS:
+                last_error = FootballAPIError(f"HTTP {response.status_code} en {endpoint} {params}")
+                retry_after = response.headers.get("Retry-After")
+                if attempt < self.retries:
+                    self._sleep_before_retry(attempt, float(retry_after) if retry_after and retry_after.isdigit() else None)
+                continue
+            if response.status_code != 200:
+                self._count("errors", call_stats)
+                raise FootballAPIError(f"HTTP {response.status_code} en {endpoint} {params}: {response.text[:200]}")
+
+            data = response.json()
+            errors = data.get("errors")
+            if errors:
+                # API-Football responde 200 con "errors" cuando se excede el límite
+                if isinstance(errors, dict) and "rateLimit" in errors:
+                    last_error = FootballAPIError(f"Límite de API en {endpoint} {params}: {errors}")
+                    self.limiter.pause(60)
+                    if attempt < self.retries:
+                        self._count("retries", call_stats)
+                    continue
+                self._count("errors", call_stats)
+                raise FootballAPIError(f"Error de API en {endpoint} {params}: {errors}")
+            if self.cache:
+                self.cache.store(
+                    endpoint, params, data.get("response", []),
+                    response.headers.get("ETag"), response.headers.get("Last-Modified")
+                )
+            return data.get("response", [])
+
+        self._count("errors", call_stats)
+        raise FootballAPIError(f"Sin respuesta tras {self.retries + 1} intentos: {last_error}")
+
+    def get_many(self, endpoint, params_list, refresh=False, call_stats=None):
+        # Pide varias consultas en paralelo (acotado); regresa [(params, respuesta | excepción)].
+        # Si se pasa call_stats (dict), ahí se suman las métricas solo de estas consultas
+        def fetch(params):
+            try:
+                return params, self.get(endpoint, params, refresh=refresh, call_stats=call_stats)
+            except FootballAPIError as e:
+                return params, e
+
+        if not params_list:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(params_list))) as pool:
+            return list(pool.map(fetch, params_list))
+
+    def fixtures_for_leagues(self, league_entries):
+        # league_entries: [(league_id, season)] -> [(league_id, season, fixtures | excepción)]
+        params_list = [{"league": league_id, "season": season} for league_id, season in league_entries]
+        return [
+            (params["league"], params["season"], result)
+            for params, result in self.get_many("fixtures", params_list)
+        ]
+
+    def fixtures_by_ids(self, fixture_ids, call_stats=None):
+        # /fixtures?ids=1-2-3 en bloques de 20; regresa (fixtures, [ids que fallaron])
+        fixture_ids = list(fixture_ids)
+        chunks = [
+            fixture_ids[i:i + FIXTURE_IDS_PER_REQUEST]
+            for i in range(0, len(fixture_ids), FIXTURE_IDS_PER_REQUEST)
+        ]
+        params_list = [{"ids": "-".join(str(fixture_id) for fixture_id in chunk)} for chunk in chunks]
+        fixtures, failed = [], []
+        for chunk, (params, result) in zip(chunks, self.get_many("fixtures", params_list, call_stats=call_stats)):
+            if isinstance(result, Exception):
+                print(f"Error al obtener fixtures {params['ids']}:", result)
+                failed.extend(chunk)
+                continue
+            fixtures.extend(result)
+        return fixtures, failed
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FootballAPIClient()
+        return _client
@@ -2,12 +2,13 @@
 import uuid
 from fastapi import APIRouter, Depends, HTTPException # type: ignore
 from sqlalchemy.orm import Session # type: ignore
-from sqlalchemy import func # type: ignore
+from sqlalchemy import func, select # type: ignore
 from pydantic import BaseModel # type: ignore
 import models
 from database import get_db
 from auth import get_current_user
 from sqlalchemy import text # type: ignore
+from response_cache import cache, group_tag, POINTS_TAG, USER_NAMES_TAG
 
 router = APIRouter(prefix="/groups")
 
@@ -68,6 +69,7 @@ def join_group(
     membership = models.GroupMember(group_id=group.id, user_id=current_user.id)
     db.add(membership)
     db.commit()
+    cache.invalidate_tags(group_tag(group.id))
 
     return {"message": "✅ Te uniste al grupo", "group_id": group.id}
 
@@ -110,46 +112,58 @@ def get_groups_with_stats(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-
-    groups = (
-        db.query(models.Group)
-        .join(models.GroupMember, models.Group.id == models.GroupMember.group_id)
-        .filter(models.GroupMember.user_id == current_user.id)
-        .all()
+    # Una sola consulta para todos los grupos del usuario. Los totales salen del
+    # ledger y solo para los miembros de esos grupos, no de toda la tabla predictions.
+    GM, Ledger = models.GroupMember, models.PointsLedger
+
+    my_group_ids = select(GM.group_id).where(GM.user_id == current_user.id)
+    fellow_user_ids = select(GM.user_id).where(GM.group_id.in_(my_group_ids))
+
+    user_totals = (
+        db.query(Ledger.user_id, func.sum(Ledger.points).label("total_points"))
+        .filter(Ledger.user_id.in_(fellow_user_ids))
+        .group_by(Ledger.user_id)
+        .subquery()
     )
-
-    result = []
-
-    for group in groups:
-        members = (
-            db.query(
-                models.User.id.label("user_id"),
-                models.User.name,
-                func.coalesce(func.sum(models.Prediction.points), 0).label("total_points")
-            )
-            .join(models.GroupMember, models.User.id == models.GroupMember.user_id)
-            .outerjoin(models.Prediction, models.User.id == models.Prediction.user_id)
-            .filter(models.GroupMember.group_id == group.id)
-            .group_by(models.User.id)
-            .order_by(func.coalesce(func.sum(models.Prediction.points), 0).desc())
-            .all()
-        )
-
-        user_ranking = next(
-            (i + 1 for i, m in enumerate(members) if m.user_id == current_user.id),
-            None
+    members = (
+        db.query(
+            GM.group_id,
+            GM.user_id,
+            func.coalesce(user_totals.c.total_points, 0).label("total_points")
         )
+        .outerjoin(user_totals, user_totals.c.user_id == GM.user_id)
+        .filter(GM.group_id.in_(my_group_ids))
+        .subquery()
+    )
+    ranked = db.query(
+        members.c.group_id,
+        members.c.user_id,
+        func.rank().over(
+            partition_by=members.c.group_id,
+            order_by=members.c.total_points.desc()
+        ).label("position"),
+        func.count().over(partition_by=members.c.group_id).label("member_count")
+    ).subquery()
+
+    rows = (
+        db.query(models.Group, ranked.c.member_count, ranked.c.position)
+        .join(ranked, ranked.c.group_id == models.Group.id)
+        .filter(ranked.c.user_id == current_user.id)
+        .order_by(models.Group.id)
+        .all()
+    )
 
-        result.append({
+    return [
+        {
             "id": group.id,
             "name": group.name,
             "invite_code": group.code,
-            "member_count": len(members),
-            "my_ranking": user_ranking,
+            "member_count": member_count,
+            "my_ranking": position,
             "is_creator": group.creator_id == current_user.id
-        })
-
-    return result
+        }
+        for group, member_count, position in rows
+    ]
 
 
 @router.get("/{group_id}/ranking")
@@ -159,6 +173,11 @@ def group_ranking(
     current_user: models.User = Depends(get_current_user)
 ):
 
+    cached = cache.get("group_ranking", group_id)
+    if cached is not None:
+        return cached
+    generation = cache.generation()
+
     group = db.query(models.Group).filter(models.Group.id == group_id).first()
     if not group:
         raise HTTPException(status_code=404, detail="Grupo no encontrado")
@@ -167,22 +186,27 @@ def group_ranking(
         db.query(
             models.User.id.label("user_id"),
             models.User.name,
-            func.coalesce(func.sum(models.Prediction.points), 0).label("total_points")
+            func.coalesce(func.sum(models.PointsLedger.points), 0).label("total_points")
         )
         .join(models.GroupMember, models.User.id == models.GroupMember.user_id)
-        .outerjoin(models.Prediction, models.User.id == models.Prediction.user_id)
+        .outerjoin(models.PointsLedger, models.User.id == models.PointsLedger.user_id)
         .filter(models.GroupMember.group_id == group_id)
         .group_by(models.User.id)
-        .order_by(func.coalesce(func.sum(models.Prediction.points), 0).desc())
+        .order_by(func.coalesce(func.sum(models.PointsLedger.points), 0).desc())
         .all()
     )
 
-    return {
+    result = {
         "group_name": group.name,
         "ranking": [
             {"user_id": m.user_id, "name": m.name, "points": m.total_points} for m in members
         ]
     }
+    # Suma puntos de todas las ligas: cualquier cambio de puntos la invalida
+    return cache.set(
+        "group_ranking", group_id, result,
+        tags=[group_tag(group_id), POINTS_TAG, USER_NAMES_TAG], generation=generation
+    )
 
 @router.delete("/{group_id}")
 def delete_group(
@@ -201,6 +225,7 @@ def delete_group(
 
     db.delete(group)
     db.commit()
+    cache.invalidate_tags(group_tag(group_id))
 
     return {"message": "🗑️ Grupo eliminado correctamente"}
 
@@ -0,0 +1,404 @@
+# jobs.py
+# Cola persistente de trabajos en segundo plano (tabla jobs).
+# Los endpoints de sincronización y avisos solo encolan; uno o más workers
+# toman los trabajos con SELECT ... FOR UPDATE SKIP LOCKED.
+# - un trabajo pendiente idéntico (tipo + parámetros) no se encola dos veces
+# - si falla se reintenta con backoff exponencial hasta max_attempts
+# - dos trabajos del mismo grupo (p. ej. sincronización de fixtures) nunca
+#   corren a la vez, aunque haya varios workers: advisory lock de Postgres
+#
+#   python jobs.py worker [--once]   -> procesa la cola (--once: hasta vaciarla)
+#   python jobs.py status            -> resumen de la cola
+#
+# JOBS_MODE=inline (por defecto) además drena la cola dentro del proceso web
+# con BackgroundTasks, para despliegues sin worker aparte. Con JOBS_MODE=worker
+# el API solo encola.
+from datetime import datetime, timedelta
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import zlib
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException # type: ignore
+from sqlalchemy import func, select, text # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+from database import SessionLocal, engine, dialect_insert
+import models
+from auth import require_update_token
+
+Job = models.Job
+
+JOBS_MODE = os.getenv("JOBS_MODE", "inline")  # inline | worker
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_SECONDS = int(os.getenv("JOB_BACKOFF_SECONDS", "30"))
+JOB_BACKOFF_MAX_SECONDS = int(os.getenv("JOB_BACKOFF_MAX_SECONDS", "1800"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "3600"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+
+router = APIRouter(prefix="/jobs")
+
+HANDLERS = {}
+# Trabajos del mismo grupo comparten lock: nunca corren dos a la vez
+LOCK_GROUPS = {
+    "update_matches": "fixtures",
+    "update_all_matches": "fixtures",
+    "update_live_matches": "live",
+    "notify_upcoming_matches": "notify",
+}
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+@handler("update_matches")
+def run_update_matches(db: Session, payload):
+    from update_matches import sync_fixtures
+    from send_notifications import notify_upcoming_matches
+    summary = sync_fixtures(db, full=payload.get("full", False))
+    # notify_upcoming_matches cierra la sesión que recibe
+    return {"sync": summary, "notify": notify_upcoming_matches(SessionLocal())}
+
+
+@handler("update_all_matches")
+def run_update_all_matches(db: Session, payload):
+    from update_matches import sync_fixtures
+    return sync_fixtures(db, full=payload.get("full", False))
+
+
+@handler("update_live_matches")
+def run_update_live_matches(db: Session, payload):
+    from update_matches import update_live_matches_from_api
+    return update_live_matches_from_api(db)
+
+
+@handler("notify_upcoming_matches")
+def run_notify_upcoming_matches(db: Session, payload):
+    from send_notifications import notify_upcoming_matches
+    return notify_upcoming_matches(db)
+
+
+def lock_group(kind):
+    return LOCK_GROUPS.get(kind, kind)
+
+
+def dedup_key(kind, payload):
+    return f"{kind}:{json.dumps(payload, sort_keys=True)}"
+
+
+def enqueue(db: Session, kind: str, payload=None, run_at=None, max_attempts=JOB_MAX_ATTEMPTS):
+    # Regresa (job_id, creado); si ya hay uno pendiente idéntico se reutiliza
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    payload = payload or {}
+    key = dedup_key(kind, payload)
+    now = datetime.utcnow()
+    stmt = dialect_insert(db, Job).values(
+        kind=kind,
+        payload=json.dumps(payload, sort_keys=True),
+        dedup_key=key,
+        status="pending",
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=run_at or now,
+        created_at=now,
+    ).on_conflict_do_nothing(
+        index_elements=["dedup_key"],
+        index_where=text("status = 'pending'")
+    ).returning(Job.id)
+    job_id = db.execute(stmt).scalar()
+    created = job_id is not None
+    if not created:
+        job_id = db.query(Job.id).filter(Job.dedup_key == key, Job.status == "pending").scalar()
+    db.commit()
+    return job_id, created
+
+
+class GroupLock:
+    # Postgres: pg_try_advisory_xact_lock en una conexión aparte cuya transacción
+    # queda abierta mientras corre el trabajo; si el worker muere, la conexión se
+    # cierra y el lock se libera solo. Funciona también con poolers en modo
+    # transacción (DB_POOL_MODE=null), a diferencia del lock de sesión.
+    # Otros motores (SQLite local): lock en memoria, un solo proceso.
+    _local_locks = {}
+    _local_guard = threading.Lock()
+
+    def __init__(self, group):
+        self.group = group
+        self.key = zlib.crc32(f"jobs:{group}".encode()) & 0x7FFFFFFF  # cabe en int4
+        self._conn = None
+        self._local = None
+
+    def acquire(self):
+        if engine.dialect.name == "postgresql":
+            conn = engine.connect()
+            try:
+                acquired = conn.execute(select(func.pg_try_advisory_xact_lock(self.key))).scalar()
+            except Exception:
+                conn.close()
+                raise
+            if not acquired:
+                conn.close()
+                return False
+            self._conn = conn
+            return True
+        with GroupLock._local_guard:
+            lock = GroupLock._local_locks.setdefault(self.group, threading.Lock())
+        if not lock.acquire(blocking=False):
+            return False
+        self._local = lock
+        return True
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.rollback()  # termina la transacción y suelta el lock
+            finally:
+                self._conn.close()
+                self._conn = None
+        if self._local is not None:
+            self._local.release()
+            self._local = None
+
+
+def backoff_delay(attempts):
+    return timedelta(seconds=min(JOB_BACKOFF_SECONDS * (2 ** (attempts - 1)), JOB_BACKOFF_MAX_SECONDS))
+
+
+def claim_next(db: Session, worker_id: str):
+    # Toma el siguiente trabajo vencido cuyo grupo esté libre; regresa (job, lock) o (None, None)
+    busy_kinds = set()
+    while True:
+        now = datetime.utcnow()
+        query = db.query(Job).filter(Job.status == "pending", Job.run_at <= now)
+        if busy_kinds:
+            query = query.filter(~Job.kind.in_(busy_kinds))
+        query = query.order_by(Job.run_at, Job.id)
+        if db.get_bind().dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        job = query.first()
+        if job is None:
+            db.rollback()
+            return None, None
+
+        lock = GroupLock(lock_group(job.kind))
+        if not lock.acquire():
+            # Otro worker está corriendo ese grupo: se prueba con los demás
+            group = lock_group(job.kind)
+            busy_kinds.update(kind for kind in HANDLERS if lock_group(kind) == group)
+            busy_kinds.add(job.kind)
+            db.rollback()
+            continue
+
+        # Sin FOR UPDATE (SQLite) otro hilo pudo tomarlo entre el SELECT y el lock
+        claimed = db.query(Job).filter(Job.id == job.id, Job.status == "pending").update({
+            Job.status: "running",
+            Job.attempts: Job.attempts + 1,
+            Job.locked_at: now,
+            Job.locked_by: worker_id,
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            lock.release()
+            continue
+        db.refresh(job)
+        return job, lock
+
+
+def run_next(worker_id: str):
+    # Procesa un trabajo; regresa su id o None si no había nada que correr
+    db = SessionLocal()
+    try:
+        job, lock = claim_next(db, worker_id)
+        if job is None:
+            return None
+        job_id, kind, payload = job.id, job.kind, json.loads(job.payload or "{}")
+        print(f"🛠️ Trabajo {job_id} ({kind}) intento {job.attempts}/{job.max_attempts}")
+
+        work_db = SessionLocal()
+        try:
+            result = HANDLERS[kind](work_db, payload)
+            error = None
+        except Exception as e:
+            work_db.rollback()
+            result = None
+            error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"
+        finally:
+            work_db.close()
+            lock.release()
+
+        job = db.get(Job, job_id)
+        now = datetime.utcnow()
+        job.locked_at = None
+        job.locked_by = None
+        if error is None:
+            job.status = "done"
+            job.finished_at = now
+            job.last_error = None
+            job.result = json.dumps(result, default=str)
+            print(f"✅ Trabajo {job_id} ({kind}) terminado")
+        elif job.attempts < job.max_attempts and not pending_duplicate(db, job):
+            job.status = "pending"
+            job.run_at = now + backoff_delay(job.attempts)
+            job.last_error = error
+            print(f"🔁 Trabajo {job_id} ({kind}) falló, se reintenta a las {job.run_at:%H:%M:%S}: {error.splitlines()[0]}")
+        else:
+            job.status = "failed"
+            job.finished_at = now
+            job.last_error = error
+            print(f"❌ Trabajo {job_id} ({kind}) falló definitivamente: {error.splitlines()[0]}")
+        db.commit()
+        return job_id
+    finally:
+        db.close()
+
+
+def pending_duplicate(db: Session, job):
+    # Si mientras corría se encoló uno idéntico, el reintento sobra (y chocaría con el índice único)
+    return db.query(
+        select(Job.id).where(Job.dedup_key == job.dedup_key, Job.status == "pending", Job.id != job.id).exists()
+    ).scalar()
+
+
+def requeue_stale(db: Session):
+    # Trabajos "running" cuyo worker murió sin terminarlos vuelven a la cola
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LEASE_SECONDS)
+    stale = db.query(Job).filter(Job.status == "running", Job.locked_at < cutoff).all()
+    for job in stale:
+        job.locked_at = None
+        job.locked_by = None
+        if job.attempts < job.max_attempts and not pending_duplicate(db, job):
+            job.status = "pending"
+            job.run_at = datetime.utcnow()
+        else:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+        job.last_error = f"Sin respuesta del worker tras {JOB_LEASE_SECONDS} s"
+    db.commit()
+    return len(stale)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def drain(max_jobs=50):
+    # Corre los trabajos vencidos hasta vaciar la cola (o max_jobs).
+    # En modo inline no hay work() que recupere los trabajos que un reinicio
+    # dejó en "running" (y cuya llave bloquea encolar otro igual): se hace aquí
+    db = SessionLocal()
+    try:
+        requeued = requeue_stale(db)
+    finally:
+        db.close()
+    if requeued:
+        print(f"♻️ {requeued} trabajos abandonados regresaron a la cola")
+    wid = worker_id()
+    processed = 0
+    while processed < max_jobs and run_next(wid) is not None:
+        processed += 1
+    return processed
+
+
+def work(once=False):
+    wid = worker_id()
+    print(f"👷 Worker {wid} esperando trabajos")
+    last_requeue = 0.0
+    while True:
+        if time.monotonic() - last_requeue > 60:
+            db = SessionLocal()
+            try:
+                requeued = requeue_stale(db)
+            finally:
+                db.close()
+            if requeued:
+                print(f"♻️ {requeued} trabajos abandonados regresaron a la cola")
+            last_requeue = time.monotonic()
+
+        if run_next(wid) is None:
+            if once:
+                return
+            time.sleep(JOB_POLL_SECONDS)
+
+
+def submit(kind, payload, background_tasks: BackgroundTasks, message: str):
+    # Usado por los endpoints: encola y, en modo inline, drena la cola al terminar la respuesta.
+    # Hace I/O síncrono con la base: desde un endpoint async llamarlo con run_in_threadpool
+    db = SessionLocal()
+    try:
+        job_id, created = enqueue(db, kind, payload)
+    finally:
+        db.close()
+    if JOBS_MODE == "inline":
+        background_tasks.add_task(drain)
+    return {"message": message, "job_id": job_id, "deduplicated": not created}
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "payload": json.loads(job.payload or "{}"),
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_at": job.run_at,
+        "locked_by": job.locked_by,
+        "last_error": job.last_error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def queue_status(db: Session, recent=20):
+    now = datetime.utcnow()
+    counts = {}
+    for kind, status, count in db.query(Job.kind, Job.status, func.count(Job.id)).group_by(Job.kind, Job.status):
+        counts.setdefault(kind, {})[status] = count
+    oldest_due = db.query(func.min(Job.run_at)).filter(Job.status == "pending", Job.run_at <= now).scalar()
+    return {
+        "mode": JOBS_MODE,
+        "counts": counts,
+        "oldest_due_seconds": round((now - oldest_due).total_seconds(), 1) if oldest_due else None,
+        "recent": [job_to_dict(job) for job in db.query(Job).order_by(Job.id.desc()).limit(recent)],
+    }
+
+
+@router.get("/status", dependencies=[Depends(require_update_token)])
+def jobs_status():
+    db = SessionLocal()
+    try:
+        return queue_status(db)
+    finally:
+        db.close()
+
+
+@router.get("/{job_id}", dependencies=[Depends(require_update_token)])
+def job_detail(job_id: int):
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+        return job_to_dict(job)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        models.Base.metadata.create_all(bind=engine, tables=[Job.__table__])
+        work(once="--once" in sys.argv)
+    elif len(sys.argv) > 1 and sys.argv[1] == "status":
+        db = SessionLocal()
+        print(json.dumps(queue_status(db), default=str, indent=2))
+        db.close()
+    else:
+        print("Uso: python jobs.py worker [--once] | status")
@@ -0,0 +1,173 @@
+# ledger.py
+# Mantiene points_ledger: puntos por (usuario, liga, temporada, ronda).
+# Los endpoints de ranking leen de aquí en vez de sumar toda la tabla predictions.
+#
+#   python ledger.py rebuild   -> reconstruye el ledger desde predictions
+#   python ledger.py check     -> compara el ledger contra predictions
+import sys
+from collections import defaultdict
+from sqlalchemy import func, select # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+from database import SessionLocal, dialect_insert
+import models
+
+L = models.PointsLedger
+
+
+def ledger_key(user_id, match):
+    return (user_id, match.league_id, match.league_season, match.league_round)
+
+
+def round_is_active(db: Session, match):
+    # True si algún usuario ya tiene fila para la ronda del partido
+    return db.query(L.id).filter(
+        L.league_id == match.league_id,
+        L.league_season == match.league_season,
+        L.league_round == match.league_round
+    ).first() is not None
+
+
+def apply_deltas(db: Session, deltas):
+    # deltas: {(user_id, league_id, league_season, league_round): delta}
+    # Un delta 0 solo asegura que la fila exista (la ronda cuenta como activa)
+    rows = [
+        {
+            "user_id": key[0],
+            "league_id": key[1],
+            "league_season": key[2],
+            "league_round": key[3],
+            "points": delta
+        }
+        for key, delta in deltas.items()
+        if None not in key
+    ]
+    if not rows:
+        return 0
+
+    stmt = dialect_insert(db, L).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "league_id", "league_season", "league_round"],
+        set_={"points": L.points + stmt.excluded.points}
+    )
+    db.execute(stmt)
+    return len(rows)
+
+
+def move_match_points(db: Session, moves):
+    # moves: {match_id: (llave vieja, llave nueva)}, llaves (league_id, league_season, league_round).
+    # Cuando el feed cambia la ronda, liga o temporada de un partido, los
+    # puntos ya guardados de sus pronósticos pasan de la fila vieja a la nueva.
+    # Se llama después de actualizar matches; regresa las ligas afectadas.
+    if not moves:
+        return set()
+    P, M = models.Prediction, models.Match
+    deltas = defaultdict(int)
+    rows = (
+        db.query(P.user_id, P.match_id, func.coalesce(P.points, 0))
+        .filter(P.match_id.in_(list(moves)))
+        .all()
+    )
+    for user_id, match_id, points in rows:
+        old, new = moves[match_id]
+        deltas[(user_id, *old)] -= points
+        deltas[(user_id, *new)] += points
+    apply_deltas(db, deltas)
+
+    # Sin pronósticos en la ronda vieja la fila en 0 sobra (la ronda ya no está activa)
+    db.flush()
+    for old in {old for old, _ in moves.values()}:
+        if None in old:
+            continue
+        remaining = (
+            select(P.id)
+            .join(M, P.match_id == M.id)
+            .where(
+                P.user_id == L.user_id,
+                M.league_id == old[0],
+                M.league_season == old[1],
+                M.league_round == old[2]
+            )
+            .correlate(L)
+            .exists()
+        )
+        db.query(L).filter(
+            L.league_id == old[0],
+            L.league_season == old[1],
+            L.league_round == old[2],
+            L.points == 0,
+            ~remaining
+        ).delete(synchronize_session=False)
+
+    return {key[:2] for move in moves.values() for key in move if None not in key}
+
+
+def expected_points_query(db: Session):
+    # Agregado de referencia calculado desde predictions
+    P, M = models.Prediction, models.Match
+    return (
+        db.query(
+            P.user_id,
+            M.league_id,
+            M.league_season,
+            M.league_round,
+            func.coalesce(func.sum(P.points), 0).label("points")
+        )
+        .join(M, P.match_id == M.id)
+        .filter(
+            M.league_id.isnot(None),
+            M.league_season.isnot(None),
+            M.league_round.isnot(None)
+        )
+        .group_by(P.user_id, M.league_id, M.league_season, M.league_round)
+    )
+
+
+def rebuild_ledger(db: Session):
+    db.query(L).delete(synchronize_session=False)
+    select_stmt = expected_points_query(db).statement
+    db.execute(
+        dialect_insert(db, L).from_select(
+            ["user_id", "league_id", "league_season", "league_round", "points"],
+            select_stmt
+        )
+    )
+    db.commit()
+    return db.query(L).count()
+
+
+def check_ledger(db: Session):
+    # Regresa [(key, esperado, ledger)] para cada llave que no coincide
+    expected = {tuple(row[:4]): row.points for row in expected_points_query(db)}
+    actual = {
+        (row.user_id, row.league_id, row.league_season, row.league_round): row.points
+        for row in db.query(L.user_id, L.league_id, L.league_season, L.league_round, L.points)
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        exp = expected.get(key)
+        act = actual.get(key)
+        # Una llave ausente equivale a 0 puntos
+        if (exp or 0) != (act or 0):
+            mismatches.append((key, exp, act))
+    return sorted(mismatches, key=lambda m: tuple(str(part) for part in m[0]))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    db = SessionLocal()
+    try:
+        if command == "rebuild":
+            total = rebuild_ledger(db)
+            print(f"✅ Ledger reconstruido: {total} filas")
+        elif command == "check":
+            mismatches = check_ledger(db)
+            for key, exp, act in mismatches:
+                print(f"❌ {key}: predictions={exp} ledger={act}")
+            print(f"{'✅' if not mismatches else '❌'} {len(mismatches)} diferencias")
+            sys.exit(1 if mismatches else 0)
+        else:
+            print("Uso: python ledger.py [rebuild|check]")
+            sys.exit(2)
+    finally:
+        db.close()
@@ -1,17 +1,36 @@
 from fastapi import FastAPI, Depends, HTTPException, Request, APIRouter # type: ignore
 from sqlalchemy.orm import Session # type: ignore
 from fastapi.responses import JSONResponse # type: ignore
-from database import SessionLocal, engine, Base
-import models, schemas, utils, auth
+from starlette.concurrency import run_in_threadpool # type: ignore
+from database import SessionLocal, engine, Base, get_db, get_db_runner
+import database
+import models, schemas, utils, auth, scoring, ledger, ranking_cache, jobs
 from fastapi.middleware.cors import CORSMiddleware # type: ignore
 from auth import get_current_user
+from competitions import get_league_filters, get_user_league_filters
+from response_cache import cache as response_cache
 import os
 from sqlalchemy import text # type: ignore
 import time
 from sqlalchemy.exc import OperationalError # type: ignore
+from contextlib import asynccontextmanager
+import response_cache as response_cache_module
+import scheduler
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Invalidaciones publicadas por workers y otros procesos (ver response_cache.py)
+    response_cache_module.start_invalidation_listener()
+    # Programador de sondeos en vivo dentro del proceso web (ver scheduler.py)
+    if scheduler.SCHEDULER_ENABLED:
+        scheduler.start()
+    yield
+    scheduler.stop()
+    response_cache_module.stop_invalidation_listener()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 def root():
@@ -33,24 +52,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+import send_notifications  # registra SentNotification antes de create_all
 Base.metadata.create_all(bind=engine)
 
-# Dependency: cada vez que se hace un request, se abre una sesión de BD
-def get_db():
-    db = SessionLocal()
-    from sqlalchemy import text # type: ignore
-    from sqlalchemy.exc import PendingRollbackError # type: ignore
-
-    try:
-        db.execute(text("SELECT 1"))
-    except PendingRollbackError:
-        print("[DB] Rollback pendiente detectado")
-        db.rollback()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @app.post("/users/")
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Verifica si ya existe el correo
@@ -81,6 +85,12 @@ def create_prediction(
     if not match:
         raise HTTPException(status_code=404, detail="Partido no encontrado")
 
+    # Igual que al editar: solo antes del inicio. La sincronización solo
+    # recalcula puntos cuando cambia el marcador, así que un pronóstico
+    # creado con el resultado ya puesto nunca se puntuaría.
+    if match.match_date is None or match.match_date <= datetime.utcnow():
+        raise HTTPException(status_code=400, detail="El partido ya comenzó")
+
     existing = db.query(models.Prediction).filter_by(
         user_id=current_user.id,
         match_id=pred.match_id
@@ -96,7 +106,12 @@ def create_prediction(
         points=0
     )
     db.add(new_prediction)
+    # La fila del ledger marca la ronda como activa aunque aún no haya puntos
+    new_round = not ledger.round_is_active(db, match)
+    ledger.apply_deltas(db, {ledger.ledger_key(current_user.id, match): 0})
     db.commit()
+    if new_round:
+        ranking_cache.invalidate_leagues([(match.league_id, match.league_season)])
     db.refresh(new_prediction)
     return {
         "prediction_id": new_prediction.id,
@@ -124,123 +139,205 @@ def update_match_result(
     match.status_short = result.status_short
     match.status_elapsed = result.status_elapsed
     match.status_extra = result.status_extra
-    db.commit()
-
-    # Obtener todos los pronósticos de ese partido
-    predictions = db.query(models.Prediction).filter_by(match_id=match_id).all()
-
-    # Regla para calcular puntos:
-    # - 3 puntos si acierta marcador exacto
-    # - 1 punto si acierta al ganador
-    # - 0 en otro caso
-    for pred in predictions:
-        points = 0
-        if pred.pred_home == match.score_home and pred.pred_away == match.score_away:
-            points = 3
-        elif (
-            (pred.pred_home > pred.pred_away and match.score_home > match.score_away) or
-            (pred.pred_home < pred.pred_away and match.score_home < match.score_away) or
-            (pred.pred_home == pred.pred_away and match.score_home == match.score_away)
-        ):
-            points = 1
-        pred.points = points
 
+    # Recalcular puntos en la base con un solo UPDATE (ver scoring.py para la regla)
+    rescored = scoring.rescore_matches(db, [match_id])
+    updated = rescored["predictions"]
     db.commit()
+    ranking_cache.invalidate_leagues(rescored["leagues"])
 
-    return {"message": f"Resultado actualizado y puntos recalculados para {len(predictions)} pronósticos"}
+    return {
+        "message": f"Resultado actualizado y puntos recalculados para {updated} pronósticos",
+        "predictions_updated": updated
+    }
 
 from sqlalchemy import func # type: ignore
 
 from sqlalchemy import func # type: ignore
 from collections import defaultdict
 
-from sqlalchemy import tuple_ # type: ignore
+from sqlalchemy import tuple_, and_, select, join, union_all, literal, null, cast, Integer, String # type: ignore
+from fastapi import Query # type: ignore
+from typing import Optional
+
+RANKING_PAGE_SIZE = 100
+RANKING_MAX_PAGE_SIZE = 500
 
 @app.get("/ranking/")
-def get_ranking(
+async def get_ranking(
     competition_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=RANKING_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    around_me: bool = False,
+    around_window: int = Query(5, ge=0, le=50),
+    current_user: Optional[auth.UserSnapshot] = Depends(auth.get_optional_user_async),
+    db: database.DBRunner = Depends(get_db_runner)
 ):
+    # Sin limit/offset/around_me se responde el ranking completo, como antes
+    # (lo usa Ranking.jsx); con ellos, una página ordenada en SQL.
+    # around_me toma como ancla al usuario autenticado, nunca un id arbitrario.
+    around_user = None
+    if around_me:
+        if current_user is None:
+            raise HTTPException(status_code=401, detail="around_me requiere iniciar sesión")
+        around_user = current_user.id
+    elif limit is None and offset > 0:
+        limit = RANKING_PAGE_SIZE
+
+    # Respuesta cacheada por competencia y página; se invalida al escribir resultados
+    key = (competition_id, limit, offset, around_user, around_window)
+    entry = ranking_cache.get(key)
+    if entry is None:
+        generation = ranking_cache.generation()
+        payload, league_filters = await db.run(
+            build_ranking, competition_id, limit, offset, around_user, around_window
+        )
+        entry = ranking_cache.put(key, competition_id, league_filters, payload, generation)
+    return ranking_cache.respond(entry, request)
+
+@app.get("/ranking/cache-stats", dependencies=[Depends(auth.require_update_token)])
+def get_ranking_cache_stats():
+    return ranking_cache.stats()
+
+@app.get("/cache/stats", dependencies=[Depends(auth.require_update_token)])
+def get_response_cache_stats():
+    return response_cache.stats()
+
+@app.get("/football-api/stats", dependencies=[Depends(auth.require_update_token)])
+def get_football_api_stats():
+    from football_api import get_client
+    return get_client().snapshot()
+
+@app.get("/health/db", dependencies=[Depends(auth.require_update_token)])
+def get_db_health():
+    try:
+        latency_ms = database.check_db()
+    except OperationalError as e:
+        # El detalle del driver (host, usuario) solo va al log
+        print("❌ Falló el chequeo de la base de datos:", e.orig)
+        return JSONResponse(status_code=503, content={"status": "error", "detail": "Base de datos no disponible", "pool": database.pool_stats()})
+    return {"status": "ok", "latency_ms": latency_ms, "pool": database.pool_stats()}
+
+@app.get("/auth/hash-pool-stats", dependencies=[Depends(auth.require_update_token)])
+def get_hash_pool_stats():
+    return {
+        **utils.hash_pool_stats,
+        "workers": utils.PASSWORD_HASH_WORKERS,
+        "max_pending": utils.PASSWORD_HASH_MAX_PENDING,
+        "bcrypt_rounds": utils.BCRYPT_ROUNDS,
+    }
+
+def build_ranking(db: Session, competition_id: int, limit: Optional[int], offset: int,
+                  around_user: Optional[int] = None, around_window: int = 5):
+    # limit=None sin around_user: todos los miembros, con el formato original
+    unpaged = limit is None and around_user is None
     # Obtener las ligas asociadas a la competencia
     competition = db.query(models.Competition).filter(models.Competition.id == competition_id).first()
     if not competition:
         raise HTTPException(status_code=404, detail="Competencia no encontrada")
 
-    league_filters = db.query(models.CompetitionLeague.league_id, models.CompetitionLeague.league_season).filter(
-        models.CompetitionLeague.competition_id == competition_id
-    ).all()
+    league_filters = get_league_filters(db, competition_id)
 
+    page_info = {} if unpaged else {"total": 0, "limit": limit, "offset": offset}
     if not league_filters:
-        return {"rounds": [], "ranking": []}
+        return {"rounds": [], "ranking": [], **page_info}, []
+
+    Member, Ledger = models.CompetitionMember, models.PointsLedger
+    in_leagues = tuple_(Ledger.league_id, Ledger.league_season).in_(league_filters)
 
     # 1. Obtener rondas activas en esas ligas
     active_rounds = (
-        db.query(models.Match.league_round)
-        .join(models.Prediction, models.Prediction.match_id == models.Match.id)
-        .filter(
-            tuple_(
-                models.Match.league_id,
-                models.Match.league_season
-            ).in_(league_filters)
-        )
+        db.query(Ledger.league_round)
+        .filter(in_leagues)
         .distinct()
-        .order_by(models.Match.league_round)
+        .order_by(Ledger.league_round)
         .all()
     )
     rounds = [r[0] for r in active_rounds]
 
-    # 2. Obtener usuarios inscritos en esta competencia
-    user_ids = db.query(models.CompetitionMember.user_id).filter(
-        models.CompetitionMember.competition_id == competition_id
-    ).all()
-    user_ids = [u[0] for u in user_ids]
-    users = db.query(models.User).filter(models.User.id.in_(user_ids)).all()
-
-    # 3. Obtener puntos por usuario y ronda
-    round_points = (
+    # 2. Totales por miembro y posición calculada en SQL.
+    # RANK() da la misma posición a los empates (1, 1, 3); row_number solo
+    # fija un orden estable para paginar.
+    totals = (
         db.query(
-            models.User.id.label("user_id"),
-            models.Match.league_round,
-            func.sum(models.Prediction.points).label("points")
-        )
-        .join(models.Prediction, models.User.id == models.Prediction.user_id)
-        .join(models.Match, models.Prediction.match_id == models.Match.id)
-        .filter(
-            models.User.id.in_(user_ids),
-            tuple_(models.Match.league_id, models.Match.league_season).in_(league_filters),
-            models.Match.league_round.in_(rounds)
+            Member.user_id.label("user_id"),
+            models.User.name.label("name"),
+            models.User.email.label("email"),
+            func.coalesce(func.sum(Ledger.points), 0).label("total_points")
         )
-        .group_by(models.User.id, models.Match.league_round)
-        .all()
+        .join(models.User, models.User.id == Member.user_id)
+        .outerjoin(Ledger, and_(Ledger.user_id == Member.user_id, in_leagues))
+        .filter(Member.competition_id == competition_id)
+        .group_by(Member.user_id, models.User.name, models.User.email)
+        .subquery()
     )
+    ranked = db.query(
+        totals.c.user_id,
+        totals.c.name,
+        totals.c.email,
+        totals.c.total_points,
+        func.rank().over(order_by=totals.c.total_points.desc()).label("position"),
+        func.row_number().over(order_by=(totals.c.total_points.desc(), totals.c.user_id)).label("row_num")
+    ).subquery()
+
+    if not unpaged:
+        page_info["total"] = (
+            db.query(func.count(func.distinct(Member.user_id)))
+            .filter(Member.competition_id == competition_id)
+            .scalar()
+        )
 
+    page = db.query(ranked).order_by(ranked.c.row_num)
+    if around_user is not None:
+        # N filas arriba y abajo del usuario indicado
+        anchor = db.query(ranked.c.row_num).filter(ranked.c.user_id == around_user).scalar()
+        if anchor is None:
+            raise HTTPException(status_code=404, detail="El usuario no está inscrito en esta competencia")
+        page = page.filter(ranked.c.row_num.between(anchor - around_window, anchor + around_window))
+        page_info["around_user"] = around_user
+        page_info["offset"] = max(anchor - around_window - 1, 0)
+    elif not unpaged:
+        page = page.offset(offset).limit(limit)
+    page = page.all()
+
+    # 3. Puntos por ronda solo para los usuarios de la página (desde el ledger)
+    page_user_ids = [row.user_id for row in page]
+    round_points = []
+    if page_user_ids and rounds:
+        round_points = (
+            db.query(
+                Ledger.user_id,
+                Ledger.league_round,
+                func.sum(Ledger.points).label("points")
+            )
+            .filter(
+                Ledger.user_id.in_(page_user_ids),
+                in_leagues,
+                Ledger.league_round.in_(rounds)
+            )
+            .group_by(Ledger.user_id, Ledger.league_round)
+            .all()
+        )
     points_by_user_round = {(rp.user_id, rp.league_round): rp.points for rp in round_points}
 
-    result = []
-    for user in users:
-        entry = {
-            "user_id": user.id,
-            "name": user.name,
-            "email": user.email,
-            "rounds": {},
-            "total_points": 0
+    result = [
+        {
+            "user_id": row.user_id,
+            "name": row.name,
+            **({"email": row.email} if unpaged else {}),
+            "rounds": {rnd: points_by_user_round.get((row.user_id, rnd), 0) for rnd in rounds},
+            "total_points": row.total_points,
+            "position": row.position
         }
-        total = 0
-        for rnd in rounds:
-            pts = points_by_user_round.get((user.id, rnd), 0)
-            entry["rounds"][rnd] = pts
-            total += pts
-        entry["total_points"] = total
-        result.append(entry)
-
-    result.sort(key=lambda x: x["total_points"], reverse=True)
-    for idx, entry in enumerate(result, start=1):
-        entry["position"] = idx
+        for row in page
+    ]
 
     return {
         "rounds": rounds,
-        "ranking": result
-    }
+        "ranking": result,
+        **page_info
+    }, league_filters
 
 
 from datetime import datetime
@@ -267,10 +364,16 @@ def update_prediction(
     if match.match_date <= datetime.utcnow():
         raise HTTPException(status_code=400, detail="El partido ya comenzó")
 
+    if prediction.points:
+        ledger.apply_deltas(db, {ledger.ledger_key(current_user.id, match): -prediction.points})
+
     prediction.pred_home = update.pred_home
     prediction.pred_away = update.pred_away
+    had_points = bool(prediction.points)
     prediction.points = 0
     db.commit()
+    if had_points:
+        ranking_cache.invalidate_leagues([(match.league_id, match.league_season)])
     db.refresh(prediction)
 
     return {
@@ -286,24 +389,22 @@ def update_prediction(
 from sqlalchemy import and_ # type: ignore
 
 @app.get("/available-matches/")
-def get_available_matches(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+async def get_available_matches(
+    current_user: models.User = Depends(auth.get_current_user_async),
+    db: database.DBRunner = Depends(get_db_runner)
 ):
+    return await db.run(list_available_matches, current_user.id)
+
+def list_available_matches(db: Session, user_id: int):
     now = datetime.utcnow()
 
     # Obtener ligas de las competencias donde el usuario está inscrito
-    league_filters = db.query(
-        models.CompetitionLeague.league_id,
-        models.CompetitionLeague.league_season
-    ).join(models.Competition, models.Competition.id == models.CompetitionLeague.competition_id
-    ).join(models.CompetitionMember, models.CompetitionMember.competition_id == models.Competition.id
-    ).filter(models.CompetitionMember.user_id == current_user.id).all()
+    league_filters = get_user_league_filters(db, user_id)
 
     if not league_filters:
         return []
 
-    subquery = db.query(models.Prediction.match_id).filter(models.Prediction.user_id == current_user.id)
+    subquery = db.query(models.Prediction.match_id).filter(models.Prediction.user_id == user_id)
 
     matches = (
         db.query(models.Match)
@@ -356,10 +457,7 @@ def get_available_matches_by_competition(
         raise HTTPException(status_code=403, detail="No estás inscrito en esta competencia")
 
     # Obtener ligas de la competencia
-    league_filters = db.query(
-        models.CompetitionLeague.league_id,
-        models.CompetitionLeague.league_season
-    ).filter(models.CompetitionLeague.competition_id == competition_id).all()
+    league_filters = get_league_filters(db, competition_id)
 
     if not league_filters:
         return []
@@ -399,14 +497,17 @@ def get_available_matches_by_competition(
     ]
 
 @app.get("/my-predictions/")
-def get_user_predictions(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+async def get_user_predictions(
+    current_user: models.User = Depends(auth.get_current_user_async),
+    db: database.DBRunner = Depends(get_db_runner)
 ):
+    return await db.run(list_user_predictions, current_user.id)
+
+def list_user_predictions(db: Session, user_id: int):
     predictions = (
         db.query(models.Prediction, models.Match)
         .join(models.Match, models.Prediction.match_id == models.Match.id)
-        .filter(models.Prediction.user_id == current_user.id)
+        .filter(models.Prediction.user_id == user_id)
         .order_by(models.Match.match_date)
         .all()
     )
@@ -456,10 +557,7 @@ def get_user_predictions_by_competition(
         raise HTTPException(status_code=403, detail="No estás inscrito en esta competencia")
 
     # Obtener ligas asociadas a la competencia
-    league_filters = db.query(
-        models.CompetitionLeague.league_id,
-        models.CompetitionLeague.league_season
-    ).filter(models.CompetitionLeague.competition_id == competition_id).all()
+    league_filters = get_league_filters(db, competition_id)
 
     if not league_filters:
         return []
@@ -507,7 +605,7 @@ from fastapi.security import OAuth2PasswordRequestForm # type: ignore
 import auth
 
 @app.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_db)):
+def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Credenciales incorrectas")
@@ -517,15 +615,11 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer","user_id": user.id}
 
 @app.get("/me")
-def get_my_profile(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+async def get_my_profile(
+    current_user: models.User = Depends(auth.get_current_user_async),
+    db: database.DBRunner = Depends(get_db_runner)
 ):
-    total_points = (
-        db.query(func.coalesce(func.sum(models.Prediction.points), 0))
-        .filter(models.Prediction.user_id == current_user.id)
-        .scalar()
-    )
+    total_points = await db.run(user_total_points, current_user.id)
 
     return {
         "user_id": current_user.id,
@@ -535,6 +629,13 @@ def get_my_profile(
         "total_points": total_points
     }
 
+def user_total_points(db: Session, user_id: int):
+    return (
+        db.query(func.coalesce(func.sum(models.PointsLedger.points), 0))
+        .filter(models.PointsLedger.user_id == user_id)
+        .scalar()
+    )
+
 
 from fastapi import BackgroundTasks # type: ignore
 
@@ -548,20 +649,8 @@ async def notify_upcoming(
     if secret != os.getenv("UPDATE_SECRET"):
         raise HTTPException(status_code=403, detail="No autorizado")
 
-    from send_notifications import notify_upcoming_matches
-    from database import SessionLocal
-
-    def run_notification():
-        db_session = SessionLocal()
-        try:
-            notify_upcoming_matches(db_session)
-        except Exception as e:
-            print("❌ Error en notificación:", e)
-        finally:
-            db_session.close()
-
-    background_tasks.add_task(run_notification)
-    return {"message": "🔔 Notificación iniciada en segundo plano"}
+    # Se encola en la tabla jobs (ver jobs.py); un aviso pendiente no se duplica
+    return await run_in_threadpool(jobs.submit, "notify_upcoming_matches", {}, background_tasks, "🔔 Notificación encolada")
 
 
 
@@ -569,29 +658,15 @@ async def notify_upcoming(
 @app.post("/update-all-matches")
 async def update_all_matches(
     request: Request,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    full: bool = False
 ):
     secret = request.headers.get("X-Update-Token")
     if secret != os.getenv("UPDATE_SECRET"):
         raise HTTPException(status_code=403, detail="No autorizado")
 
-    from update_matches import get_fixtures, upsert_matches_to_db
-    from database import SessionLocal
-
-    def run_full_update():
-        db_session = SessionLocal()
-        try:
-            fixtures = get_fixtures()
-            upsert_matches_to_db(fixtures, db_session)
-            db_session.commit()
-        except Exception as e:
-            db_session.rollback()
-            print("❌ Error en actualización completa:", e)
-        finally:
-            db_session.close()
-
-    background_tasks.add_task(run_full_update)
-    return {"message": "📅 Actualización completa iniciada en segundo plano"}
+    # Incremental por defecto; ?full=true vuelve a bajar las temporadas completas
+    return await run_in_threadpool(jobs.submit, "update_all_matches", {"full": full}, background_tasks, "📅 Actualización completa encolada")
 
 # Nuevo endpoint: actualización de partidos en vivo
 @app.post("/update-live-matches")
@@ -603,35 +678,24 @@ async def update_live_matches(
     if secret != os.getenv("UPDATE_SECRET"):
         raise HTTPException(status_code=403, detail="No autorizado")
 
-    from update_matches import update_live_matches_from_api
-    from database import SessionLocal
-
-    def run_live_update():
-        db_session = SessionLocal()
-        try:
-            update_live_matches_from_api(db_session)
-        except Exception as e:
-            db_session.rollback()
-            print("❌ Error en actualización de partidos en vivo:", e)
-        finally:
-            db_session.close()
-
-    background_tasks.add_task(run_live_update)
-    return {"message": "⏱️ Actualización de partidos en vivo iniciada en segundo plano"}
+    return await run_in_threadpool(jobs.submit, "update_live_matches", {}, background_tasks, "⏱️ Actualización de partidos en vivo encolada")
 
 
 # Nuevo endpoint: matriz de enfrentamientos por ronda
 @app.get("/round-matrix/")
-def get_round_matrix(
+async def get_round_matrix(
     competition_id: int,
     league_round: str,
-    db: Session = Depends(get_db)
+    format: str = Query("rows", pattern="^(rows|columnar)$"),
+    db: database.DBRunner = Depends(get_db_runner)
 ):
+    if format == "columnar":
+        return await db.run(build_round_matrix_columnar, competition_id, league_round)
+    return await db.run(build_round_matrix, competition_id, league_round)
+
+def build_round_matrix(db: Session, competition_id: int, league_round: str):
     # Obtener ligas y temporadas asociadas a la competencia
-    league_filters = db.query(
-        models.CompetitionLeague.league_id,
-        models.CompetitionLeague.league_season
-    ).filter(models.CompetitionLeague.competition_id == competition_id).all()
+    league_filters = get_league_filters(db, competition_id)
     if not league_filters:
         return {"rounds": [], "users": [], "matrix": [], "matches": [], "predictions": []}
 
@@ -645,21 +709,19 @@ def get_round_matrix(
     user_ids = [u[0] for u in user_ids]
     users = db.query(models.User).filter(models.User.id.in_(user_ids)).all()
 
-    # Obtener puntos por usuario SOLO para la ronda específica
+    # Obtener puntos por usuario SOLO para la ronda específica (desde el ledger)
     round_points = (
         db.query(
-            models.User.id.label("user_id"),
-            models.Match.league_round,
-            func.sum(models.Prediction.points).label("points")
+            models.PointsLedger.user_id,
+            models.PointsLedger.league_round,
+            func.sum(models.PointsLedger.points).label("points")
         )
-        .join(models.Prediction, models.User.id == models.Prediction.user_id)
-        .join(models.Match, models.Prediction.match_id == models.Match.id)
         .filter(
-            models.User.id.in_(user_ids),
-            tuple_(models.Match.league_id, models.Match.league_season).in_(league_filters),
-            models.Match.league_round == league_round
+            models.PointsLedger.user_id.in_(user_ids),
+            tuple_(models.PointsLedger.league_id, models.PointsLedger.league_season).in_(league_filters),
+            models.PointsLedger.league_round == league_round
         )
-        .group_by(models.User.id, models.Match.league_round)
+        .group_by(models.PointsLedger.user_id, models.PointsLedger.league_round)
         .all()
     )
     points_by_user_round = {(rp.user_id, rp.league_round): rp.points for rp in round_points}
@@ -736,35 +798,98 @@ def get_round_matrix(
     }
 
 
+ROUND_MATRIX_MATCH_COLUMNS = (
+    "home_team", "away_team", "home_team_logo", "away_team_logo",
+    "score_home", "score_away", "match_date",
+    "status_long", "status_short", "status_elapsed", "status_extra",
+)
+
+def build_round_matrix_columnar(db: Session, competition_id: int, league_round: str):
+    # Todo en una sola consulta: los partidos de la ronda y los miembros con sus
+    # pronósticos se unen con UNION ALL, distinguidos por la columna "kind".
+    # La respuesta va en columnas: ids de usuarios, ids de partidos y una matriz
+    # de puntos [usuario][partido] (null si no pronosticó).
+    M, P = models.Match, models.Prediction
+    CL, CM = models.CompetitionLeague, models.CompetitionMember
+
+    round_matches = (
+        select(M.id, *[getattr(M, c) for c in ROUND_MATRIX_MATCH_COLUMNS])
+        .join(CL, and_(CL.league_id == M.league_id, CL.league_season == M.league_season))
+        .where(CL.competition_id == competition_id, M.league_round == league_round)
+        .distinct()
+        .cte("round_matches")
+    )
+    members = (
+        select(CM.user_id, models.User.name)
+        .join(models.User, models.User.id == CM.user_id)
+        .where(CM.competition_id == competition_id)
+        .distinct()
+        .cte("members")
+    )
+
+    match_rows = select(
+        literal("m").label("kind"),
+        cast(null(), Integer).label("user_id"),
+        cast(null(), String).label("name"),
+        round_matches.c.id.label("match_id"),
+        cast(null(), Integer).label("points"),
+        *[round_matches.c[c] for c in ROUND_MATRIX_MATCH_COLUMNS]
+    )
+    predicted = join(P, round_matches, P.match_id == round_matches.c.id)
+    member_rows = select(
+        literal("u").label("kind"),
+        members.c.user_id,
+        members.c.name,
+        P.match_id,
+        P.points,
+        *[cast(null(), round_matches.c[c].type).label(c) for c in ROUND_MATRIX_MATCH_COLUMNS]
+    ).select_from(members.outerjoin(predicted, P.user_id == members.c.user_id))
+
+    rows = db.execute(union_all(match_rows, member_rows)).all()
+
+    matches = sorted(
+        (row for row in rows if row.kind == "m"),
+        key=lambda row: (row.match_date is None, row.match_date, row.match_id)
+    )
+    match_ids = [row.match_id for row in matches]
+    match_index = {match_id: i for i, match_id in enumerate(match_ids)}
+
+    names = {}
+    points_by_user = {}
+    for row in rows:
+        if row.kind != "u":
+            continue
+        names[row.user_id] = row.name
+        points = points_by_user.setdefault(row.user_id, [None] * len(match_ids))
+        if row.match_id is not None:
+            points[match_index[row.match_id]] = row.points
+
+    user_ids = sorted(names)
+    matrix = [points_by_user[user_id] for user_id in user_ids]
+
+    return {
+        "format": "columnar",
+        "rounds": [league_round],
+        "user_ids": user_ids,
+        "user_names": [names[user_id] for user_id in user_ids],
+        "round_points": [sum(p or 0 for p in row) for row in matrix],
+        "match_ids": match_ids,
+        "matches": {c: [getattr(row, c) for row in matches] for c in ROUND_MATRIX_MATCH_COLUMNS},
+        "points": matrix,
+    }
+
+
 @app.post("/update-matches")
 async def run_update_script(
     request: Request,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    full: bool = False
 ):
     secret = request.headers.get("X-Update-Token")
     if secret != os.getenv("UPDATE_SECRET"):
         raise HTTPException(status_code=403, detail="No autorizado")
 
-    from update_matches import get_fixtures, upsert_matches_to_db
-    from send_notifications import notify_upcoming_matches
-    from database import SessionLocal
-
-    def run_update():
-        db_session = SessionLocal()
-        try:
-            fixtures = get_fixtures()
-            upsert_matches_to_db(fixtures, db_session)
-            db_session.commit()
-            notify_upcoming_matches(db_session)
-        except Exception as e:
-            db_session.rollback()
-            print("❌ Error en background:", e)
-        finally:
-            db_session.close()
-
-    background_tasks.add_task(run_update)
-
-    return {"message": "⏳ Actualización iniciada en segundo plano"}
+    return await run_in_threadpool(jobs.submit, "update_matches", {"full": full}, background_tasks, "⏳ Actualización encolada")
 
 from push_notifications import router as push_router
 app.include_router(push_router)
@@ -776,4 +901,6 @@ from groups import router as groups_router
 app.include_router(groups_router)
 
 from competitions import router as competitions_router
-app.include_router(competitions_router)
\ No newline at end of file
+app.include_router(competitions_router)
+
+app.include_router(jobs.router)
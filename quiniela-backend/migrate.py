@@ -0,0 +1,90 @@
+# migrate.py
+# Migraciones de datos puntuales: corren una vez por base desde la línea de
+# comandos (o el paso de release), nunca dentro de un request o un trabajo.
+# Cada paso aplicado queda registrado en schema_migrations.
+#
+#   python migrate.py            -> aplica los pasos pendientes, en orden
+#   python migrate.py list       -> muestra qué pasos ya se aplicaron
+#   python migrate.py <paso>     -> vuelve a correr solo ese paso
+import sys
+from datetime import datetime
+from sqlalchemy import text # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+from database import SessionLocal, engine
+import models
+import ledger
+import reminders
+from send_notifications import SentNotification
+
+
+def sent_notifications_unique(db: Session):
+    # create_all no agrega índices a una tabla que ya existe: se borran los
+    # avisos duplicados y se crea el índice único que usa record_sent
+    SentNotification.__table__.create(bind=db.get_bind(), checkfirst=True)
+    deleted = db.execute(text("""
+        DELETE FROM sent_notifications
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM sent_notifications GROUP BY user_id, match_id, type
+        )
+    """)).rowcount
+    db.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_sent_notifications_key
+        ON sent_notifications (user_id, match_id, type)
+    """))
+    db.commit()
+    return f"{deleted} avisos duplicados borrados"
+
+
+def notification_schedule_backfill(db: Session):
+    # Partidos futuros creados antes de la cola de recordatorios
+    return f"{reminders.backfill_schedule(db)} avisos agendados"
+
+
+def points_ledger_rebuild(db: Session):
+    # Los rankings leen de points_ledger: se llena una vez con los pronósticos existentes
+    models.PointsLedger.__table__.create(bind=db.get_bind(), checkfirst=True)
+    return f"{ledger.rebuild_ledger(db)} filas en el ledger"
+
+
+# Orden de aplicación
+STEPS = {
+    "points_ledger_rebuild": points_ledger_rebuild,
+    "sent_notifications_unique": sent_notifications_unique,
+    "notification_schedule_backfill": notification_schedule_backfill,
+}
+
+
+def applied_steps(db: Session):
+    return {row.name for row in db.query(models.SchemaMigration.name)}
+
+
+def run_step(db: Session, name):
+    print(f"▶️ {name}")
+    detail = STEPS[name](db)
+    db.merge(models.SchemaMigration(name=name, applied_at=datetime.utcnow()))
+    db.commit()
+    print(f"✅ {name}: {detail}")
+
+
+if __name__ == "__main__":
+    models.SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    command = sys.argv[1] if len(sys.argv) > 1 else "pending"
+    db = SessionLocal()
+    try:
+        if command == "pending":
+            done = applied_steps(db)
+            pending = [name for name in STEPS if name not in done]
+            for name in pending:
+                run_step(db, name)
+            if not pending:
+                print("Sin migraciones pendientes")
+        elif command == "list":
+            done = applied_steps(db)
+            for name in STEPS:
+                print(f"{'✔' if name in done else ' '} {name}")
+        elif command in STEPS:
+            run_step(db, command)
+        else:
+            print("Uso: python migrate.py [list | <paso>]")
+    finally:
+        db.close()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean # type: ignore
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, UniqueConstraint, Index, text # type: ignore
 from sqlalchemy.sql import func # type: ignore
 from sqlalchemy.orm import relationship # type: ignore
 from database import Base
@@ -47,6 +47,93 @@ class Prediction(Base):
     points = Column(Integer, default=0)
 
 
+class PointsLedger(Base):
+    # Agregado de Prediction.points por usuario y ronda; se mantiene con deltas (ver ledger.py)
+    __tablename__ = "points_ledger"
+    __table_args__ = (
+        UniqueConstraint("user_id", "league_id", "league_season", "league_round", name="uq_points_ledger_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    league_id = Column(Integer, nullable=False)
+    league_season = Column(Integer, nullable=False)
+    league_round = Column(String, nullable=False)
+    points = Column(Integer, nullable=False, default=0)
+
+
+class FixtureSyncCursor(Base):
+    # Última sincronización de fixtures por liga y temporada (ver update_matches.sync_fixtures)
+    __tablename__ = "fixture_sync_cursors"
+
+    league_id = Column(Integer, primary_key=True)
+    league_season = Column(Integer, primary_key=True)
+    last_synced_at = Column(DateTime(timezone=False), nullable=True)
+    last_full_sync_at = Column(DateTime(timezone=False), nullable=True)
+
+
+class NotificationSchedule(Base):
+    # Cola de recordatorios por partido: hora exacta de envío de T-24h y T-1h (ver reminders.py)
+    __tablename__ = "notification_schedule"
+    __table_args__ = (
+        UniqueConstraint("match_id", "type", name="uq_notification_schedule_key"),
+        Index("ix_notification_schedule_due", "send_at", "processed_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    match_id = Column(Integer, ForeignKey("matches.id", ondelete="CASCADE"), nullable=False)
+    type = Column(String, nullable=False)  # "24h" o "1h"
+    send_at = Column(DateTime(timezone=False), nullable=False)
+    processed_at = Column(DateTime(timezone=False), nullable=True)
+
+
+class Job(Base):
+    # Cola de trabajos en segundo plano (sincronización y avisos, ver jobs.py)
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Como máximo un trabajo pendiente idéntico (mismo tipo y parámetros)
+        Index(
+            "uq_jobs_pending_dedup", "dedup_key", unique=True,
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+        Index("ix_jobs_claim", "status", "run_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON
+    dedup_key = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime(timezone=False), nullable=False)
+    locked_at = Column(DateTime(timezone=False), nullable=True)
+    locked_by = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime(timezone=False), nullable=False)
+    finished_at = Column(DateTime(timezone=False), nullable=True)
+
+
+class SchemaMigration(Base):
+    # Migraciones de datos ya aplicadas (ver migrate.py)
+    __tablename__ = "schema_migrations"
+
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime(timezone=False), nullable=False)
+
+
+class CacheInvalidation(Base):
+    # Invalidaciones de response_cache publicadas para los demás procesos (ver response_cache.py)
+    __tablename__ = "cache_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    tags = Column(Text, nullable=False)  # JSON; ["*"] = vaciar toda la caché
+    origin = Column(String, nullable=False)  # proceso que la publicó
+    created_at = Column(DateTime(timezone=False), nullable=False, index=True)
+
+
 class PushSubscription(Base):
     __tablename__ = "push_subscriptions"
 
@@ -7,11 +7,12 @@ from sqlalchemy import text # type: ignore
 import models
 from database import get_db
 from pydantic import BaseModel # type: ignore
-from passlib.context import CryptContext # type: ignore
 from auth import get_current_user  # asegúrate de tener esta importación
+import auth
+import utils
+from response_cache import cache, USER_NAMES_TAG
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
@@ -95,7 +96,7 @@ def reset_password(
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     # Hash de la nueva contraseña
-    new_hash = pwd_context.hash(payload.new_password)
+    new_hash = utils.hash_password(payload.new_password)
     user.password_hash = new_hash
 
     # Marcar el token como usado
@@ -107,6 +108,7 @@ def reset_password(
     )
 
     db.commit()
+    auth.invalidate_user(user.id)
     return {"message": "✅ Contraseña actualizada correctamente"}
 
 
@@ -120,10 +122,13 @@ def update_name(
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    current_user.name = payload.name
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    user.name = payload.name
     db.commit()
-    db.refresh(current_user)
-    return {"message": "Nombre actualizado correctamente", "name": current_user.name}
+    auth.invalidate_user(user.id)
+    # Los rankings muestran el nombre de cada miembro
+    cache.invalidate_tags(USER_NAMES_TAG)
+    return {"message": "Nombre actualizado correctamente", "name": user.name}
 
 # Endpoint para actualizar el correo electrónico del usuario autenticado
 class UpdateUserEmailPayload(BaseModel):
@@ -140,7 +145,10 @@ def update_email(
     if existing and existing.id != current_user.id:
         raise HTTPException(status_code=400, detail="Este correo ya está en uso")
 
-    current_user.email = payload.email
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    user.email = payload.email
     db.commit()
-    db.refresh(current_user)
-    return {"message": "Correo actualizado correctamente", "email": current_user.email}
\ No newline at end of file
+    auth.invalidate_user(user.id)
+    # El ranking sin paginar también muestra el correo de cada miembro
+    cache.invalidate_tags(USER_NAMES_TAG)
+    return {"message": "Correo actualizado correctamente", "email": user.email}
\ No newline at end of file
@@ -5,11 +5,26 @@ from pydantic import BaseModel # type: ignore
 import models
 from database import get_db
 from auth import get_current_user
-from pywebpush import webpush, WebPushException # type: ignore
+from pywebpush import WebPusher, WebPushException # type: ignore
+from py_vapid import Vapid # type: ignore
 import os
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
 from sqlalchemy import text # type: ignore
 
+# Envío concurrente de notificaciones push
+PUSH_MAX_WORKERS = int(os.getenv("PUSH_MAX_WORKERS", "16"))
+PUSH_TIMEOUT = float(os.getenv("PUSH_TIMEOUT", "10"))
+PUSH_TTL = int(os.getenv("PUSH_TTL", "86400"))
+VAPID_SUBJECT = os.getenv("VAPID_SUBJECT", "mailto:admin@tu-app.com")
+VAPID_HEADER_LIFETIME = 12 * 60 * 60  # máximo que aceptan los servicios push
+VAPID_HEADER_REFRESH = 60 * 60        # se regenera si le queda menos de esto
+
 router = APIRouter()
 
 # ✅ Modelo actualizado para coincidir con lo que envía el frontend
@@ -49,14 +64,126 @@ def subscribe_to_notifications(
 
 def send_push_message(subscription, title, body):
     try:
-        webpush(
-            subscription_info=json.loads(subscription),
-            data=json.dumps({"title": title, "body": body}),
-            vapid_private_key=os.getenv("VAPID_PRIVATE_KEY"),
-            vapid_claims={
-                "sub": "mailto:admin@tu-app.com"
+        status = get_dispatcher().send(json.loads(subscription), title, body)
+        if status > 202:
+            raise WebPushException(f"Push failed: {status}")
+        print(f"✅ Notificación enviada: {title}")
+    except (WebPushException, requests.RequestException) as ex:
+        print("❌ Error al enviar push:", repr(ex))
+
+
+class PushDispatcher:
+    # Envía lotes de notificaciones con un pool de hilos acotado.
+    # - una sesión HTTP (keep-alive) por servicio push (FCM, Mozilla, Apple...)
+    # - encabezados VAPID firmados una vez por servicio y reutilizados hasta que expiran
+    # - las suscripciones que responden 404/410 ya no existen y se borran
+    def __init__(self, vapid_private_key=None, max_workers=PUSH_MAX_WORKERS):
+        self.max_workers = max_workers
+        key = vapid_private_key or os.getenv("VAPID_PRIVATE_KEY")
+        if not key:
+            raise WebPushException("Falta VAPID_PRIVATE_KEY")
+        self._vapid = Vapid.from_string(private_key=key)
+        self._lock = threading.Lock()
+        self._vapid_headers = {}  # origen -> (encabezados, expiración)
+        self._sessions = {}       # origen -> requests.Session
+
+    def _origin(self, endpoint):
+        url = urlparse(endpoint)
+        return f"{url.scheme}://{url.netloc}"
+
+    def vapid_headers(self, origin):
+        now = time.time()
+        with self._lock:
+            cached = self._vapid_headers.get(origin)
+            if cached is None or cached[1] - now < VAPID_HEADER_REFRESH:
+                expires = int(now) + VAPID_HEADER_LIFETIME
+                headers = self._vapid.sign({"sub": VAPID_SUBJECT, "aud": origin, "exp": expires})
+                cached = (headers, expires)
+                self._vapid_headers[origin] = cached
+            return cached[0]
+
+    def session_for(self, origin):
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[origin] = session
+            return session
+
+    def send(self, subscription_info, title, body):
+        # Regresa el código HTTP del servicio push
+        origin = self._origin(subscription_info["endpoint"])
+        response = WebPusher(subscription_info, requests_session=self.session_for(origin)).send(
+            json.dumps({"title": title, "body": body}),
+            dict(self.vapid_headers(origin)),
+            ttl=PUSH_TTL,
+            timeout=PUSH_TIMEOUT,
+        )
+        return response.status_code
+
+    def dispatch(self, db: Session, messages):
+        # messages: dicts con subscription_id, endpoint, p256dh_key, auth_key, title, body.
+        # Regresa métricas del lote y marca en cada mensaje "ok" (True/False).
+        def deliver(message):
+            subscription_info = {
+                "endpoint": message["endpoint"],
+                "keys": {"p256dh": message["p256dh_key"], "auth": message["auth_key"]},
             }
+            try:
+                return self.send(subscription_info, message["title"], message["body"])
+            except (WebPushException, requests.RequestException, ValueError) as ex:
+                print("❌ Error al enviar push:", repr(ex))
+                return None
+
+        start = time.perf_counter()
+        if messages:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(messages))) as pool:
+                statuses = list(pool.map(deliver, messages))
+        else:
+            statuses = []
+        elapsed = time.perf_counter() - start
+
+        by_status, gone_ids = {}, set()
+        for message, status in zip(messages, statuses):
+            message["ok"] = status is not None and status <= 202
+            key = "error" if status is None else str(status)
+            by_status[key] = by_status.get(key, 0) + 1
+            if status in (404, 410):
+                gone_ids.add(message["subscription_id"])
+
+        if gone_ids:
+            db.query(models.PushSubscription).filter(
+                models.PushSubscription.id.in_(gone_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+        sent = sum(1 for message in messages if message["ok"])
+        metrics = {
+            "messages": len(messages),
+            "sent": sent,
+            "failed": len(messages) - sent,
+            "pruned_subscriptions": len(gone_ids),
+            "by_status": by_status,
+            "seconds": round(elapsed, 3),
+            "per_second": round(len(messages) / elapsed, 1) if elapsed > 0 else None,
+        }
+        print(
+            f"📨 Push: {sent}/{len(messages)} enviados en {metrics['seconds']} s "
+            f"({metrics['per_second']}/s), {metrics['failed']} fallidos, "
+            f"{len(gone_ids)} suscripciones eliminadas"
         )
-        print(f"✅ Notificación enviada: {title}")
-    except WebPushException as ex:
-        print("❌ Error al enviar push:", repr(ex))
\ No newline at end of file
+        return metrics
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = PushDispatcher()
+        return _dispatcher
\ No newline at end of file
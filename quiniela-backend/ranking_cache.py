@@ -0,0 +1,66 @@
+# ranking_cache.py
+# Caché de las respuestas de /ranking/ sobre response_cache.
+# El ranking solo cambia cuando se escribe un resultado (o cambia la membresía),
+# así que las rutas que escriben invalidan por liga o por competencia.
+# El TTL es solo un respaldo por si alguna escritura no invalida.
+import hashlib
+import json
+import os
+import threading
+from fastapi import Request, Response # type: ignore
+from response_cache import (
+    cache, competition_tag, league_tag, POINTS_TAG, USER_NAMES_TAG
+)
+
+RANKING_CACHE_TTL = int(os.getenv("RANKING_CACHE_TTL", "300"))
+ENDPOINT = "ranking"
+
+_lock = threading.Lock()
+_not_modified = 0
+
+
+def generation():
+    return cache.generation()
+
+
+def get(key):
+    return cache.get(ENDPOINT, key)
+
+
+def put(key, competition_id, leagues, payload, built_at_generation):
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    entry = {
+        "body": body,
+        "etag": '"' + hashlib.sha1(body).hexdigest() + '"',
+    }
+    tags = [competition_tag(competition_id), USER_NAMES_TAG]
+    tags += [league_tag(league_id, league_season) for league_id, league_season in leagues]
+    return cache.set(
+        ENDPOINT, key, entry,
+        ttl=RANKING_CACHE_TTL, tags=tags, size=len(body), generation=built_at_generation
+    )
+
+
+def respond(entry, request: Request):
+    global _not_modified
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == entry["etag"]:
+        with _lock:
+            _not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+def invalidate_competition(competition_id):
+    cache.invalidate_tags(competition_tag(competition_id))
+
+
+def invalidate_leagues(leagues):
+    # leagues: iterable de (league_id, league_season) cuyos puntos cambiaron
+    tags = {league_tag(league_id, league_season) for league_id, league_season in leagues}
+    if tags:
+        cache.invalidate_tags(POINTS_TAG, *tags)
+
+
+def stats():
+    return {**cache.stats(ENDPOINT), "not_modified": _not_modified}
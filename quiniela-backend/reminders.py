@@ -0,0 +1,88 @@
+# reminders.py
+# Cola persistente de recordatorios (notification_schedule).
+# Al insertar o reprogramar un partido se calcula la hora exacta de cada aviso
+# (T-24h y T-1h). notify_upcoming_matches solo procesa lo que ya venció, así
+# que el cron puede correr cada minuto sin volver a revisar todos los partidos.
+#
+#   python reminders.py backfill   -> agenda los partidos futuros que no tengan avisos
+#                                     (en un despliegue nuevo: python migrate.py)
+from datetime import datetime, timedelta
+import sys
+from sqlalchemy import select # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+from database import SessionLocal, dialect_insert
+import models
+
+S = models.NotificationSchedule
+
+REMINDER_OFFSETS = {
+    "24h": timedelta(hours=24),
+    "1h": timedelta(hours=1),
+}
+
+def schedule_match_reminders(db: Session, matches):
+    # matches: [(match_id, match_date)] recién insertados o con fecha nueva.
+    # Si la hora de envío cambia, el aviso vuelve a quedar pendiente.
+    # Los partidos que ya empezaron no se agendan.
+    now = datetime.utcnow()
+    rows = [
+        {"match_id": match_id, "type": notif_type, "send_at": match_date - offset, "processed_at": None}
+        for match_id, match_date in matches
+        if match_date is not None and match_date > now
+        for notif_type, offset in REMINDER_OFFSETS.items()
+    ]
+    if not rows:
+        return 0
+
+    for i in range(0, len(rows), 1000):
+        stmt = dialect_insert(db, S).values(rows[i:i + 1000])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["match_id", "type"],
+            set_={"send_at": stmt.excluded.send_at, "processed_at": None},
+            where=S.send_at != stmt.excluded.send_at
+        )
+        db.execute(stmt)
+    return len(rows)
+
+
+def backfill_schedule(db: Session, now=None):
+    # Agenda los partidos futuros que aún no tienen avisos (p. ej. creados antes de la cola)
+    now = now or datetime.utcnow()
+    missing = (
+        db.query(models.Match.id, models.Match.match_date)
+        .filter(
+            models.Match.match_date > now,
+            ~select(S.id).where(S.match_id == models.Match.id).exists()
+        )
+        .all()
+    )
+    count = schedule_match_reminders(db, missing)
+    db.commit()
+    return count
+
+
+def due_reminders(db: Session, now):
+    # Avisos vencidos y sin procesar: [(schedule_id, match_id, type, match_date)]
+    return (
+        db.query(S.id, S.match_id, S.type, models.Match.match_date)
+        .join(models.Match, models.Match.id == S.match_id)
+        .filter(S.send_at <= now, S.processed_at.is_(None))
+        .order_by(S.send_at)
+        .all()
+    )
+
+
+def mark_processed(db: Session, schedule_ids, now):
+    if schedule_ids:
+        db.query(S).filter(S.id.in_(schedule_ids)).update(
+            {S.processed_at: now}, synchronize_session=False
+        )
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        print(f"Avisos agendados: {backfill_schedule(db)}")
+    else:
+        print("Uso: python reminders.py backfill")
+    db.close()
@@ -0,0 +1,288 @@
+# response_cache.py
+# Caché en memoria (por proceso) para respuestas de los routers.
+# - LRU acotada por un presupuesto de memoria (RESPONSE_CACHE_MAX_BYTES)
+# - TTL por entrada
+# - invalidación por etiquetas, p. ej. "competition:42" al unirse o borrar
+# - estadísticas de aciertos y memoria por endpoint (GET /cache/stats)
+# - invalidación entre procesos (RESPONSE_CACHE_SYNC=1): cada invalidación se
+#   publica en la tabla cache_invalidations y el proceso web la aplica en menos
+#   de RESPONSE_CACHE_SYNC_SECONDS. Así un worker de jobs.py o el programador en
+#   otro proceso también vacían la caché del API al escribir resultados.
+#   Por defecto solo se activa con JOBS_MODE=worker: con un solo proceso no
+#   aporta nada y el sondeo no dejaría que una base serverless se suspenda.
+#   Con varios procesos web o el programador aparte, activarla a mano.
+#
+# Los valores guardados se comparten entre requests: no deben mutarse.
+from datetime import datetime, timedelta
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_DEFAULT_TTL = int(os.getenv("RESPONSE_CACHE_DEFAULT_TTL", "300"))
+RESPONSE_CACHE_SYNC = os.getenv(
+    "RESPONSE_CACHE_SYNC", "1" if os.getenv("JOBS_MODE", "inline") == "worker" else "0"
+) == "1"
+RESPONSE_CACHE_SYNC_SECONDS = float(os.getenv("RESPONSE_CACHE_SYNC_SECONDS", "5"))
+RESPONSE_CACHE_SYNC_RETENTION = timedelta(hours=1)
+
+_MISSING = object()
+
+
+def estimate_size(value):
+    # Aproximación del costo en memoria: tamaño del JSON equivalente
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, default_ttl=RESPONSE_CACHE_DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (endpoint, key) -> entry
+        self._tags = {}                 # tag -> set de (endpoint, key)
+        self._bytes = 0
+        self._generation = 0
+        self._endpoint_stats = {}
+        self._evictions = 0
+        self.publish = None  # fn(tags) para avisar a otros procesos
+
+    def _stats_for(self, endpoint):
+        return self._endpoint_stats.setdefault(
+            endpoint, {"hits": 0, "misses": 0, "invalidations": 0, "entries": 0, "bytes": 0}
+        )
+
+    def generation(self):
+        # Tomarla antes de consultar la base y pasarla a set(): si hubo una
+        # invalidación mientras tanto, el valor ya viejo no se guarda
+        return self._generation
+
+    def get(self, endpoint, key, default=None):
+        full_key = (endpoint, key)
+        with self._lock:
+            stats = self._stats_for(endpoint)
+            entry = self._entries.get(full_key)
+            if entry is not None and entry["expires_at"] < time.monotonic():
+                self._remove(full_key)
+                entry = None
+            if entry is None:
+                stats["misses"] += 1
+                return default
+            self._entries.move_to_end(full_key)
+            stats["hits"] += 1
+            return entry["value"]
+
+    def set(self, endpoint, key, value, ttl=None, tags=(), size=None, generation=None):
+        full_key = (endpoint, key)
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return value
+
+        entry = {
+            "value": value,
+            "size": size,
+            "expires_at": time.monotonic() + (self.default_ttl if ttl is None else ttl),
+            "tags": frozenset(tags),
+        }
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return value
+            if full_key in self._entries:
+                self._remove(full_key)
+
+            self._entries[full_key] = entry
+            self._bytes += size
+            stats = self._stats_for(endpoint)
+            stats["entries"] += 1
+            stats["bytes"] += size
+            for tag in entry["tags"]:
+                self._tags.setdefault(tag, set()).add(full_key)
+
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+        return value
+
+    def get_or_set(self, endpoint, key, loader, ttl=None, tags=()):
+        value = self.get(endpoint, key, _MISSING)
+        if value is _MISSING:
+            generation = self.generation()
+            value = self.set(endpoint, key, loader(), ttl=ttl, tags=tags, generation=generation)
+        return value
+
+    def invalidate_tags(self, *tags, publish=True):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for full_key in list(self._tags.get(tag, ())):
+                    self._stats_for(full_key[0])["invalidations"] += 1
+                    self._remove(full_key)
+        if publish and tags and self.publish is not None:
+            self.publish(list(tags))
+
+    def clear(self, publish=True):
+        with self._lock:
+            self._generation += 1
+            for full_key in list(self._entries):
+                self._remove(full_key)
+        if publish and self.publish is not None:
+            self.publish([ALL_TAGS])
+
+    def _remove(self, full_key):
+        # Llamar con el lock tomado
+        entry = self._entries.pop(full_key, None)
+        if entry is None:
+            return
+        self._bytes -= entry["size"]
+        stats = self._stats_for(full_key[0])
+        stats["entries"] -= 1
+        stats["bytes"] -= entry["size"]
+        for tag in entry["tags"]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(full_key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self, endpoint=None):
+        with self._lock:
+            endpoints = {}
+            for name, stats in self._endpoint_stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                endpoints[name] = {
+                    **stats,
+                    "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else None,
+                }
+            if endpoint is not None:
+                return endpoints.get(endpoint, {})
+            return {
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "entries": len(self._entries),
+                "evictions": self._evictions,
+                "endpoints": endpoints,
+            }
+
+
+ALL_TAGS = "*"
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+_table_ready = False
+_listener = None
+
+
+def _invalidations_table():
+    # Import diferido: database/models no deben cargarse solo por importar la caché
+    global _table_ready
+    from database import engine
+    import models
+    table = models.CacheInvalidation.__table__
+    if not _table_ready:
+        table.create(bind=engine, checkfirst=True)
+        _table_ready = True
+    return engine, table
+
+
+def publish_invalidation(tags):
+    # Llamar después del commit de la escritura que invalida
+    try:
+        engine, table = _invalidations_table()
+        with engine.begin() as conn:
+            conn.execute(table.insert().values(
+                tags=json.dumps(tags), origin=ORIGIN, created_at=datetime.utcnow()
+            ))
+    except Exception as e:
+        # La caché local ya se invalidó; los demás procesos caen al TTL
+        print("⚠️ No se pudo publicar la invalidación de caché:", e)
+
+
+def apply_remote_invalidations(last_id):
+    # Aplica las invalidaciones de otros procesos con id > last_id; regresa el último id visto
+    from sqlalchemy import func, select # type: ignore
+    engine, table = _invalidations_table()
+    with engine.connect() as conn:
+        if last_id is None:
+            # Al arrancar la caché está vacía: solo interesa lo que venga después
+            return conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+        rows = conn.execute(
+            select(table.c.id, table.c.tags, table.c.origin)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+        ).all()
+    for row in rows:
+        last_id = row.id
+        if row.origin == ORIGIN:
+            continue
+        tags = json.loads(row.tags)
+        if ALL_TAGS in tags:
+            cache.clear(publish=False)
+        else:
+            cache.invalidate_tags(*tags, publish=False)
+    return last_id
+
+
+def prune_invalidations():
+    engine, table = _invalidations_table()
+    with engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.created_at < datetime.utcnow() - RESPONSE_CACHE_SYNC_RETENTION))
+
+
+def _listen(stop):
+    last_id, last_prune = None, 0.0
+    while not stop.is_set():
+        try:
+            last_id = apply_remote_invalidations(last_id)
+            if time.monotonic() - last_prune > 600:
+                prune_invalidations()
+                last_prune = time.monotonic()
+        except Exception as e:
+            print("⚠️ Error al leer invalidaciones de caché:", e)
+        stop.wait(RESPONSE_CACHE_SYNC_SECONDS)
+
+
+def start_invalidation_listener():
+    # Hilo del proceso web que sirve respuestas cacheadas (ver main.py)
+    global _listener
+    if not RESPONSE_CACHE_SYNC or (_listener is not None and _listener[0].is_alive()):
+        return
+    stop = threading.Event()
+    thread = threading.Thread(target=_listen, args=(stop,), name="cache-invalidations", daemon=True)
+    thread.start()
+    _listener = (thread, stop)
+
+
+def stop_invalidation_listener():
+    global _listener
+    if _listener is not None:
+        _listener[1].set()
+        _listener[0].join(timeout=5)
+        _listener = None
+
+
+cache = ResponseCache()
+if RESPONSE_CACHE_SYNC:
+    cache.publish = publish_invalidation
+
+
+def competition_tag(competition_id):
+    return f"competition:{competition_id}"
+
+
+def league_tag(league_id, league_season):
+    return f"league:{league_id}:{league_season}"
+
+
+def group_tag(group_id):
+    return f"group:{group_id}"
+
+
+# Etiquetas globales
+COMPETITION_LEAGUES_TAG = "competition_leagues"
+PUBLIC_COMPETITIONS_TAG = "public_competitions"
+POINTS_TAG = "points"          # cualquier cambio de puntos
+USER_NAMES_TAG = "user_names"  # respuestas que muestran nombres de usuario
@@ -0,0 +1,233 @@
+# scheduler.py
+# Programador interno de la sincronización en vivo, guiado por el calendario.
+# En vez de un cron que pega a /update-live-matches cada minuto (aunque no
+# haya partidos), se leen las fechas de los partidos:
+# - hay partidos en juego o por empezar (LIVE_PREMATCH_MINUTES) -> sondeo
+#   en vivo cada LIVE_POLL_SECONDS
+# - si no -> se duerme hasta el siguiente saque inicial, con una
+#   sincronización incremental de fixtures cada SCHEDULER_SYNC_SECONDS para
+#   enterarse de cambios de horario
+# Solo un nodo lo corre: el que tenga el advisory lock de Postgres (líder).
+# Los trabajos se encolan en jobs.py, así que tampoco se enciman con los
+# que lleguen por los endpoints.
+#
+#   SCHEDULER_ENABLED=1          -> arranca con la app (main.py)
+#   python scheduler.py          -> como proceso aparte
+#   python scheduler.py plan     -> muestra el plan actual y sale
+from datetime import datetime, timedelta
+import os
+import sys
+import threading
+import time
+import zlib
+from sqlalchemy import create_engine, func, select # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+from database import SessionLocal, engine, engine_options
+from update_matches import FINISHED_STATUSES, IN_PLAY_STATUSES
+import jobs
+import models
+
+Match = models.Match
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1"
+LIVE_POLL_SECONDS = int(os.getenv("LIVE_POLL_SECONDS", "60"))
+LIVE_PREMATCH_MINUTES = int(os.getenv("LIVE_PREMATCH_MINUTES", "10"))
+# Un partido sin estado final se considera posible en juego hasta este tiempo después del inicio
+LIVE_MATCH_MAX_MINUTES = int(os.getenv("LIVE_MATCH_MAX_MINUTES", "180"))
+SCHEDULER_SYNC_SECONDS = int(os.getenv("SCHEDULER_SYNC_SECONDS", "21600"))
+SCHEDULER_MAX_SLEEP_SECONDS = int(os.getenv("SCHEDULER_MAX_SLEEP_SECONDS", "900"))
+SCHEDULER_LEADER_RETRY_SECONDS = int(os.getenv("SCHEDULER_LEADER_RETRY_SECONDS", "60"))
+# El lock del líder es de sesión: con un pooler en modo transacción
+# (DB_POOL_MODE=null) hay que apuntar aquí a la conexión directa
+SCHEDULER_DATABASE_URL = os.getenv("SCHEDULER_DATABASE_URL")
+
+LEADER_LOCK_KEY = zlib.crc32(b"scheduler:leader") & 0x7FFFFFFF
+
+# Estados sin juego que esperar: terminados, más aplazados (PST), suspendidos
+# (SUSP) y sin hora definida (TBD), cuya match_date ya no es el saque inicial
+NOT_PLAYING_STATUSES = FINISHED_STATUSES + ("PST", "SUSP", "TBD")
+
+state = {"leader": False, "plan": None, "last_live_poll": None, "last_sync": None}
+
+
+def live_window_matches(db: Session, now: datetime):
+    # Partidos en juego o que empiezan dentro de la ventana previa
+    window_start = now - timedelta(minutes=LIVE_MATCH_MAX_MINUTES)
+    window_end = now + timedelta(minutes=LIVE_PREMATCH_MINUTES)
+    return (
+        db.query(func.count(Match.id))
+        .filter(
+            Match.status_short.in_(IN_PLAY_STATUSES)
+            | (
+                Match.match_date.between(window_start, window_end)
+                & (Match.status_short.is_(None) | ~Match.status_short.in_(NOT_PLAYING_STATUSES))
+            )
+        )
+        .scalar()
+    )
+
+
+def next_kickoff(db: Session, now: datetime):
+    return (
+        db.query(func.min(Match.match_date))
+        .filter(
+            Match.match_date > now,
+            Match.status_short.is_(None) | ~Match.status_short.in_(NOT_PLAYING_STATUSES)
+        )
+        .scalar()
+    )
+
+
+def plan(db: Session, now: datetime, last_sync=None):
+    # Regresa {"live": bool, "sync": bool, "sleep": segundos, "reason": texto}
+    sync_due = last_sync is None or (now - last_sync).total_seconds() >= SCHEDULER_SYNC_SECONDS
+    next_sync_in = SCHEDULER_SYNC_SECONDS if sync_due else SCHEDULER_SYNC_SECONDS - (now - last_sync).total_seconds()
+
+    active = live_window_matches(db, now)
+    if active:
+        return {
+            "live": True, "sync": sync_due, "sleep": LIVE_POLL_SECONDS,
+            "reason": f"{active} partidos en juego o por empezar",
+        }
+
+    kickoff = next_kickoff(db, now)
+    if kickoff is None:
+        sleep = min(next_sync_in, SCHEDULER_MAX_SLEEP_SECONDS)
+        return {"live": False, "sync": sync_due, "sleep": sleep, "reason": "sin partidos próximos"}
+
+    # Despertar justo cuando se abra la ventana previa del siguiente partido;
+    # SCHEDULER_MAX_SLEEP_SECONDS acota la espera por si cambia el calendario
+    until_window = (kickoff - timedelta(minutes=LIVE_PREMATCH_MINUTES) - now).total_seconds()
+    sleep = max(1, min(until_window, next_sync_in, SCHEDULER_MAX_SLEEP_SECONDS))
+    return {
+        "live": False, "sync": sync_due, "sleep": sleep,
+        "reason": f"siguiente partido {kickoff:%Y-%m-%d %H:%M} UTC",
+    }
+
+
+def run_tick(now=None):
+    # Un ciclo: decide, encola lo que toque y regresa cuántos segundos dormir
+    now = now or datetime.utcnow()
+    db = SessionLocal()
+    try:
+        decision = plan(db, now, state["last_sync"])
+        if decision["sync"]:
+            jobs.enqueue(db, "update_all_matches", {"full": False})
+            state["last_sync"] = now
+        if decision["live"]:
+            jobs.enqueue(db, "update_live_matches", {})
+            state["last_live_poll"] = now
+    finally:
+        db.close()
+
+    state["plan"] = {**decision, "next_run": now + timedelta(seconds=decision["sleep"])}
+    actions = [name for name, on in (("en vivo", decision["live"]), ("fixtures", decision["sync"])) if on]
+    print(
+        f"📅 Programador: {', '.join(actions) or 'sin sondeo'} ({decision['reason']}); "
+        f"próxima revisión {state['plan']['next_run']:%H:%M:%S} UTC"
+    )
+    if (decision["live"] or decision["sync"]) and jobs.JOBS_MODE == "inline":
+        jobs.drain()
+    return decision["sleep"]
+
+
+class LeaderLock:
+    # pg_try_advisory_lock de sesión en una conexión dedicada que se mantiene
+    # abierta: si el nodo muere, Postgres suelta el lock y otro toma el relevo.
+    # Con SQLite (local) siempre es líder.
+    def __init__(self):
+        self._engine = engine
+        if SCHEDULER_DATABASE_URL:
+            self._engine = create_engine(SCHEDULER_DATABASE_URL, **engine_options())
+        self._conn = None
+
+    def acquire(self):
+        if self._engine.dialect.name != "postgresql":
+            return True
+        if self._conn is not None:
+            # Comprueba que la conexión (y con ella el lock) sigue viva
+            try:
+                self._conn.exec_driver_sql("SELECT 1")
+                self._conn.commit()
+                return True
+            except Exception as e:
+                print("⚠️ Programador: se perdió la conexión del líder:", e)
+                self.release()
+        conn = self._engine.connect()
+        try:
+            acquired = conn.execute(select(func.pg_try_advisory_lock(LEADER_LOCK_KEY))).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.invalidate()  # cerrar la conexión física suelta el lock
+            finally:
+                self._conn = None
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def run_forever(stop=_stop):
+    leader = LeaderLock()
+    try:
+        while not stop.is_set():
+            try:
+                is_leader = leader.acquire()
+            except Exception as e:
+                print("❌ Programador: no se pudo consultar el lock de líder:", e)
+                is_leader = False
+            if is_leader != state["leader"]:
+                print("👑 Programador: este nodo es el líder" if is_leader else "💤 Programador: otro nodo es el líder")
+                state["leader"] = is_leader
+            if not is_leader:
+                stop.wait(SCHEDULER_LEADER_RETRY_SECONDS)
+                continue
+            try:
+                sleep = run_tick()
+            except Exception as e:
+                print("❌ Error en el programador:", e)
+                sleep = LIVE_POLL_SECONDS
+            stop.wait(sleep)
+    finally:
+        leader.release()
+        state["leader"] = False
+
+
+def start():
+    # Hilo de fondo dentro del proceso web (SCHEDULER_ENABLED=1)
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=run_forever, name="live-scheduler", daemon=True)
+        _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "plan":
+        db = SessionLocal()
+        now = datetime.utcnow()
+        decision = plan(db, now)
+        print(f"{now:%Y-%m-%d %H:%M:%S} UTC -> {decision}")
+        db.close()
+    else:
+        try:
+            run_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,102 @@
+# scoring.py
+from sqlalchemy import case, and_, or_, update, func # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+import models
+import ledger
+
+# Regla para calcular puntos:
+# - 3 puntos si acierta marcador exacto
+# - 1 punto si acierta al ganador (o el empate)
+# - 0 en otro caso
+EXACT_POINTS = 3
+OUTCOME_POINTS = 1
+
+
+def points_for(pred_home, pred_away, score_home, score_away):
+    # Versión en Python de la regla, útil para comparar contra el SQL
+    if pred_home == score_home and pred_away == score_away:
+        return EXACT_POINTS
+    if (
+        (pred_home > pred_away and score_home > score_away) or
+        (pred_home < pred_away and score_home < score_away) or
+        (pred_home == pred_away and score_home == score_away)
+    ):
+        return OUTCOME_POINTS
+    return 0
+
+
+def points_case():
+    # Expresión CASE equivalente a points_for, leyendo el marcador de la tabla matches
+    P, M = models.Prediction, models.Match
+    return case(
+        (and_(P.pred_home == M.score_home, P.pred_away == M.score_away), EXACT_POINTS),
+        (
+            or_(
+                and_(P.pred_home > P.pred_away, M.score_home > M.score_away),
+                and_(P.pred_home < P.pred_away, M.score_home < M.score_away),
+                and_(P.pred_home == P.pred_away, M.score_home == M.score_away)
+            ),
+            OUTCOME_POINTS
+        ),
+        else_=0
+    )
+
+
+def points_deltas(db: Session, match_ids):
+    # Diferencia entre los puntos nuevos y los guardados, agrupada por llave del ledger
+    P, M = models.Prediction, models.Match
+    delta = func.sum(points_case() - func.coalesce(P.points, 0))
+    rows = (
+        db.query(P.user_id, M.league_id, M.league_season, M.league_round, delta.label("delta"))
+        .join(M, P.match_id == M.id)
+        .filter(
+            M.id.in_(match_ids),
+            M.score_home.isnot(None),
+            M.score_away.isnot(None)
+        )
+        .group_by(P.user_id, M.league_id, M.league_season, M.league_round)
+        .all()
+    )
+    return {tuple(row[:4]): row.delta for row in rows if row.delta}
+
+
+def rescore_matches(db: Session, match_ids) -> dict:
+    # Recalcula en un solo UPDATE ... FROM matches los pronósticos de todos los
+    # partidos indicados que ya tienen marcador. No hace commit: el llamador
+    # decide el límite de la transacción.
+    match_ids = list(set(match_ids))
+    if not match_ids:
+        return {"matches": 0, "predictions": 0, "leagues": set()}
+
+    # La sesión usa autoflush=False; el UPDATE debe ver los marcadores nuevos
+    db.flush()
+
+    P, M = models.Prediction, models.Match
+
+    # Bloquear los partidos serializa dos recálculos simultáneos del mismo partido,
+    # así los deltas del ledger se calculan siempre sobre los puntos ya confirmados
+    db.query(M.id).filter(M.id.in_(match_ids)).with_for_update().all()
+
+    deltas = points_deltas(db, match_ids)
+    ledger.apply_deltas(db, deltas)
+
+    stmt = (
+        update(P)
+        .where(
+            P.match_id == M.id,
+            M.id.in_(match_ids),
+            M.score_home.isnot(None),
+            M.score_away.isnot(None)
+        )
+        .values(points=points_case())
+        .execution_options(synchronize_session=False)
+    )
+    result = db.execute(stmt)
+    # Ligas cuyo ranking cambió; los llamadores invalidan cachés después del commit
+    leagues = {(key[1], key[2]) for key in deltas}
+    return {"matches": len(match_ids), "predictions": result.rowcount, "leagues": leagues}
+
+
+def score_match(db: Session, match_id: int) -> int:
+    # Un solo UPDATE para todos los pronósticos del partido; regresa las filas afectadas
+    return rescore_matches(db, [match_id])["predictions"]
@@ -1,109 +1,214 @@
 # send_notifications.py
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session # type: ignore
-from sqlalchemy import Column, Integer, String, DateTime, select # type: ignore
-from database import SessionLocal, Base
+from sqlalchemy import Column, Integer, String, DateTime, Index, select, literal # type: ignore
+from database import SessionLocal, Base, dialect_insert
 import models
-from push_notifications import send_push_message
-import json
+from push_notifications import get_dispatcher
+import reminders
+import os
 
 class SentNotification(models.Base):
     __tablename__ = "sent_notifications"
+    __table_args__ = (
+        # Un aviso por usuario, partido y tipo; permite insertar con ON CONFLICT DO NOTHING
+        Index("uq_sent_notifications_key", "user_id", "match_id", "type", unique=True),
+    )
     id = models.Column(models.Integer, primary_key=True, index=True)
     user_id = models.Column(models.Integer, index=True)
     match_id = models.Column(models.Integer, index=True)
     type = models.Column(models.String, index=True)  # "24h" o "1h"
     sent_at = models.Column(models.DateTime, default=datetime.utcnow)
 
+SENT_INSERT_CHUNK_SIZE = 1000
+# Modo resumen: un solo push por usuario, suscripción y tipo de aviso con
+# todos los partidos pendientes, en lugar de uno por partido
+NOTIFY_DIGEST = os.getenv("NOTIFY_DIGEST", "1") == "1"
+DIGEST_MAX_LISTED = 5
+# Los avisos se registran como enviados por bloques, a medida que se despachan:
+# si la corrida se corta, la siguiente no repite lo que ya salió
+NOTIFY_RECORD_CHUNK = int(os.getenv("NOTIFY_RECORD_CHUNK", "200"))
+
+def notification_candidates(db: Session, now: datetime, match_ids, notif_type_value: str):
+    # Una sola consulta con las tuplas (usuario, partido, tipo, suscripción)
+    # pendientes para los partidos dados: miembros de competencias con la liga
+    # del partido, sin pronóstico y sin aviso de ese tipo ya enviado
+    Match = models.Match
+    notif_type = literal(notif_type_value).label("type")
+
+    predicted = select(models.Prediction.id).where(
+        models.Prediction.user_id == models.CompetitionMember.user_id,
+        models.Prediction.match_id == Match.id
+    ).exists()
+    already_sent = select(SentNotification.id).where(
+        SentNotification.user_id == models.CompetitionMember.user_id,
+        SentNotification.match_id == Match.id,
+        SentNotification.type == notif_type_value
+    ).exists()
+
+    return (
+        db.query(
+            models.CompetitionMember.user_id,
+            Match.id.label("match_id"),
+            Match.home_team,
+            Match.away_team,
+            notif_type,
+            models.PushSubscription.id.label("subscription_id"),
+            models.PushSubscription.endpoint,
+            models.PushSubscription.p256dh_key,
+            models.PushSubscription.auth_key,
+        )
+        .select_from(Match)
+        .join(models.CompetitionLeague, models.CompetitionLeague.league_id == Match.league_id)
+        .join(models.CompetitionMember, models.CompetitionMember.competition_id == models.CompetitionLeague.competition_id)
+        .join(models.PushSubscription, models.PushSubscription.user_id == models.CompetitionMember.user_id)
+        .filter(
+            Match.id.in_(match_ids),
+            Match.match_date > now,
+            ~predicted,
+            ~already_sent
+        )
+        .distinct()
+        .order_by(Match.id, models.CompetitionMember.user_id)
+        .all()
+    )
+
+def record_sent(db: Session, keys):
+    # keys: {(user_id, match_id, type)}; los que ya existan se ignoran
+    if not keys:
+        return
+    sent_at = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "match_id": match_id, "type": notif_type, "sent_at": sent_at}
+        for user_id, match_id, notif_type in keys
+    ]
+    for i in range(0, len(rows), SENT_INSERT_CHUNK_SIZE):
+        stmt = dialect_insert(db, SentNotification).values(rows[i:i + SENT_INSERT_CHUNK_SIZE])
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "match_id", "type"]))
+    db.commit()
+
+def match_message(row):
+    if row.type == "24h":
+        body = f"⏰ El partido empieza mañana: {row.home_team} vs {row.away_team}. ¡Haz tu pronóstico!"
+    else:
+        body = f"⚠️ Último aviso: {row.home_team} vs {row.away_team} comienza en menos de 1 hora."
+    return f"⚽ {row.home_team} vs {row.away_team}", body
+
+def digest_message(rows):
+    if len(rows) == 1:
+        return match_message(rows[0])
+    names = [f"{row.home_team} vs {row.away_team}" for row in rows[:DIGEST_MAX_LISTED]]
+    if len(rows) > DIGEST_MAX_LISTED:
+        names.append(f"y {len(rows) - DIGEST_MAX_LISTED} más")
+    listed = ", ".join(names)
+    if rows[0].type == "24h":
+        return f"⚽ {len(rows)} partidos empiezan mañana", f"⏰ {listed}. ¡Haz tus pronósticos!"
+    return f"⚽ {len(rows)} partidos empiezan en menos de 1 hora", f"⚠️ Último aviso: {listed}."
+
+def subscription_fields(row):
+    return {
+        "subscription_id": row.subscription_id,
+        "endpoint": row.endpoint,
+        "p256dh_key": row.p256dh_key,
+        "auth_key": row.auth_key,
+    }
+
+def build_messages(candidates):
+    # Un push por (usuario, partido, suscripción)
+    messages = []
+    for row in candidates:
+        title, body = match_message(row)
+        messages.append({
+            "keys": [(row.user_id, row.match_id, row.type)],
+            **subscription_fields(row),
+            "title": title,
+            "body": body,
+        })
+    return messages
+
+def build_digest_messages(candidates):
+    # Un push por (suscripción, tipo) con todos los partidos pendientes del usuario
+    groups = {}
+    for row in candidates:
+        groups.setdefault((row.subscription_id, row.type), []).append(row)
+
+    messages = []
+    for rows in groups.values():
+        title, body = digest_message(rows)
+        messages.append({
+            "keys": [(row.user_id, row.match_id, row.type) for row in rows],
+            **subscription_fields(rows[0]),
+            "title": title,
+            "body": body,
+        })
+    return messages
+
+def merge_metrics(total, chunk):
+    # Suma las métricas de PushDispatcher.dispatch de varios bloques
+    if not total:
+        return dict(chunk)
+    merged = dict(total)
+    for key in ("messages", "sent", "failed", "pruned_subscriptions"):
+        merged[key] = total.get(key, 0) + chunk.get(key, 0)
+    merged["by_status"] = dict(total.get("by_status", {}))
+    for status, count in chunk.get("by_status", {}).items():
+        merged["by_status"][status] = merged["by_status"].get(status, 0) + count
+    merged["seconds"] = round(total.get("seconds", 0) + chunk.get("seconds", 0), 3)
+    merged["per_second"] = round(merged["messages"] / merged["seconds"], 1) if merged["seconds"] > 0 else None
+    return merged
+
 def notify_upcoming_matches(db: Session):  # 👈 recibe db como argumento
     print("🚀 Iniciando ejecución de notify_upcoming_matches")
     try:
         now = datetime.utcnow()
 
-        upper_bound_24h = now + timedelta(hours=24)
-
-        # Buscar partidos en los rangos deseados, excluyendo los que ya empezaron
-        matches = db.query(models.Match).filter(
-            models.Match.match_date <= upper_bound_24h,
-            models.Match.match_date > now
-        ).all()
-
-        for match in matches:
-            time_until_match = (match.match_date - now).total_seconds()
-
-            # Usuarios sin pronóstico
-            predicted_users = db.query(models.Prediction.user_id).filter(
-                models.Prediction.match_id == match.id
-            ).subquery()
-
-            # Subquery para competencias relacionadas con la liga del partido
-            competencias_con_liga = db.query(models.CompetitionLeague.competition_id).filter(
-                models.CompetitionLeague.league_id == match.league_id
-            ).subquery()
-
-            # Subquery para usuarios inscritos en esas competencias
-            usuarios_en_competencias = db.query(models.CompetitionMember.user_id).filter(
-                models.CompetitionMember.competition_id.in_(select(competencias_con_liga.c.competition_id))
-            ).subquery()
-
-            # Filtrar usuarios sin pronóstico y que están en una competencia con la liga del partido
-            users = db.query(models.User).filter(
-                ~models.User.id.in_(select(predicted_users.c.user_id)),
-                models.User.id.in_(select(usuarios_en_competencias.c.user_id))
-            ).all()
-
-            notif_type = "1h" if time_until_match <= 3600 else "24h"
-
-            print(f"🔔 Se enviarán {len(users)} notificaciones de tipo '{notif_type}' para el partido {match.home_team} vs {match.away_team}")
-
-            for user in users:
-                # Verifica si ya se envió esta notificación
-                already_sent = db.query(SentNotification).filter_by(
-                    user_id=user.id,
-                    match_id=match.id,
-                    type=notif_type
-                ).first()
-
-                if already_sent:
-                    continue
-
-                subs = db.query(models.PushSubscription).filter(
-                    models.PushSubscription.user_id == user.id
-                ).all()
-
-                for sub in subs:
-                    subscription = {
-                        "endpoint": sub.endpoint,
-                        "keys": {
-                            "p256dh": sub.p256dh_key,
-                            "auth": sub.auth_key,
-                        },
-                    }
-
-                    if notif_type == "24h":
-                        body = f"⏰ El partido empieza mañana: {match.home_team} vs {match.away_team}. ¡Haz tu pronóstico!"
-                    elif notif_type == "1h":
-                        body = f"⚠️ Último aviso: {match.home_team} vs {match.away_team} comienza en menos de 1 hora."
-                    else:
-                        continue
-
-                    send_push_message(
-                        json.dumps(subscription),
-                        f"⚽ {match.home_team} vs {match.away_team}",
-                        body
-                    )
-
-                    new_notif = SentNotification(
-                        user_id=user.id,
-                        match_id=match.id,
-                        type=notif_type
-                    )
-                    db.add(new_notif)
-                    db.commit()
+        # Solo los avisos de la cola cuya hora de envío ya llegó
+        due = reminders.due_reminders(db, now)
+        last_call = {item.match_id for item in due if item.type == "1h"}
+        match_ids_by_type = {"24h": [], "1h": []}
+        for item in due:
+            if item.match_date <= now:
+                continue  # el partido ya empezó
+            if item.type == "24h" and item.match_id in last_call:
+                continue  # vencieron los dos: basta con el último aviso
+            match_ids_by_type[item.type].append(item.match_id)
+
+        candidates = []
+        for notif_type, match_ids in match_ids_by_type.items():
+            if match_ids:
+                candidates.extend(notification_candidates(db, now, match_ids, notif_type))
+        print(f"🔔 {len(due)} avisos vencidos, {len(candidates)} pendientes por usuario, partido y suscripción")
+
+        messages = build_digest_messages(candidates) if NOTIFY_DIGEST else build_messages(candidates)
+        metrics = {}
+        sent = set()
+        dispatcher = None
+        if messages:
+            try:
+                dispatcher = get_dispatcher()
+            except Exception as e:
+                # Sin llave VAPID (o inválida) no sale nada; los avisos vencidos
+                # siguen pendientes y se envían en cuanto se corrija la llave
+                print("❌ No se pudo preparar el envío de pushes, se reintenta en la siguiente corrida:", e)
+                metrics["skipped"] = len(messages)
+        for i in range(0, len(messages) if dispatcher else 0, NOTIFY_RECORD_CHUNK):
+            chunk = messages[i:i + NOTIFY_RECORD_CHUNK]
+            metrics = merge_metrics(metrics, dispatcher.dispatch(db, chunk))
+            # Como antes, un intento cuenta como enviado aunque alguna suscripción falle
+            chunk_keys = {key for message in chunk for key in message["keys"]}
+            record_sent(db, chunk_keys)
+            sent |= chunk_keys
+        if dispatcher or not messages:
+            reminders.mark_processed(db, [item.id for item in due], now)
+            db.commit()
+        metrics["pushes"] = len(messages) if dispatcher else 0
+        metrics["matches_covered"] = len(sent)
+        print(f"✅ {metrics['pushes']} pushes cubrieron {len(sent)} avisos (usuario, partido)")
+        return metrics
 
     finally:
         db.close()
 
 if __name__ == "__main__":
     db = SessionLocal()
-    notify_upcoming_matches(db)
\ No newline at end of file
+    notify_upcoming_matches(db)
@@ -0,0 +1,34 @@
+# tests/conftest.py
+# Las pruebas corren desde quiniela-backend (python -m pytest) contra SQLite en memoria
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest # type: ignore
+from sqlalchemy import create_engine, event # type: ignore
+from sqlalchemy.orm import sessionmaker # type: ignore
+
+
+@pytest.fixture
+def db():
+    import models
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def count_queries(db):
+    # Regresa la lista de sentencias SQL ejecutadas mientras dura la prueba
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    yield statements
+    event.remove(db.get_bind(), "before_cursor_execute", listener)
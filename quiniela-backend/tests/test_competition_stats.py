@@ -0,0 +1,46 @@
+# tests/test_competition_stats.py
+# /my-competitions-with-stats debe hacer las mismas 3 consultas sin importar
+# cuántas competencias tenga el usuario (sin N+1)
+import pytest # type: ignore
+
+import models
+from competitions import get_my_competitions_with_stats
+
+MEMBERS_PER_COMPETITION = 5
+EXPECTED_QUERIES = 3
+
+
+def seed(db, n_competitions):
+    db.bulk_insert_mappings(models.User, [
+        {"id": u, "name": f"Usuario {u}", "email": f"u{u}@x.com", "password_hash": "x"}
+        for u in range(1, MEMBERS_PER_COMPETITION + 1)
+    ])
+    for c in range(1, n_competitions + 1):
+        db.add(models.Competition(id=c, name=f"c{c}", code=f"code{c}", is_public=False, creator_id=1))
+        db.add(models.CompetitionLeague(competition_id=c, league_id=c, league_name=f"L{c}", league_season=2025))
+        db.bulk_insert_mappings(models.CompetitionMember, [
+            {"user_id": u, "competition_id": c} for u in range(1, MEMBERS_PER_COMPETITION + 1)
+        ])
+        db.bulk_insert_mappings(models.PointsLedger, [
+            {"user_id": u, "league_id": c, "league_season": 2025, "league_round": "R1", "points": u * c}
+            for u in range(1, MEMBERS_PER_COMPETITION + 1)
+        ])
+    db.commit()
+
+
+@pytest.mark.parametrize("n_competitions", [1, 5, 20])
+def test_query_count_is_constant(db, count_queries, n_competitions):
+    seed(db, n_competitions)
+    user = db.get(models.User, 1)
+    count_queries.clear()
+
+    result = get_my_competitions_with_stats(db=db, current_user=user)
+
+    assert len(result) == n_competitions
+    assert len(count_queries) == EXPECTED_QUERIES, count_queries
+
+    # El usuario 1 tiene c puntos en la competencia c: último lugar en todas
+    for stats in result:
+        assert stats["member_count"] == MEMBERS_PER_COMPETITION
+        assert stats["my_points"] == stats["id"]
+        assert stats["my_ranking"] == MEMBERS_PER_COMPETITION
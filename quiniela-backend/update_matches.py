@@ -1,142 +1,341 @@
 import os
-import requests
-from datetime import datetime
+import sys
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv # type: ignore
 from sqlalchemy.orm import Session # type: ignore
 from database import get_db
-from models import Match
-from sqlalchemy import text # type: ignore
+from models import Match, FixtureSyncCursor
+from scoring import rescore_matches
+from football_api import get_client, FootballAPIError
+from reminders import schedule_match_reminders
+from ledger import move_match_points
+import ranking_cache
+from sqlalchemy import text, update, values, column, cast, Integer # type: ignore
 
 # Cargar claves y configuración
 load_dotenv()
-API_KEY = os.getenv("FOOTBALL_API_KEY")
-#BACKEND_URL = "https://quiniela-backend-2lc1.onrender.com"
-BACKEND_URL = os.getenv("BACKEND_URL")
 
-HEADERS = {
-    "x-apisports-key": API_KEY
-}
-BASE_URL = "https://v3.football.api-sports.io"
+# Sincronización incremental: solo se piden los partidos en una ventana de
+# fechas alrededor de hoy, más los que siguen sin terminar fuera de ella
+SYNC_WINDOW_DAYS_BACK = int(os.getenv("SYNC_WINDOW_DAYS_BACK", "3"))
+SYNC_WINDOW_DAYS_AHEAD = int(os.getenv("SYNC_WINDOW_DAYS_AHEAD", "14"))
+FINISHED_STATUSES = ("FT", "AET", "PEN", "CANC", "ABD", "AWD", "WO")
 
 def get_leagues_from_competitions(db: Session):
     # Obtener combinaciones únicas de liga y temporada desde la tabla competition_leagues
     result = db.execute(text("SELECT DISTINCT league_id, league_season FROM competition_leagues"))
     return result.fetchall()
 
-def get_fixtures():
-    db = next(get_db())
-    league_entries = get_leagues_from_competitions(db)
-    all_fixtures = []
-
-    for entry in league_entries:
-        league_id = entry[0]
-        season = entry[1]
-        print(f"Obteniendo partidos de liga {league_id} temporada {season}")
-        url = f"{BASE_URL}/fixtures?league={league_id}&season={season}"
-        response = requests.get(url, headers=HEADERS)
-        data = response.json()
-
-        if response.status_code != 200:
-            print("Error al obtener fixtures:", data)
-            continue
+# Columnas de Match que vienen del feed; su tupla es la "huella" del partido
+MATCH_FIELDS = (
+    "home_team", "away_team", "match_date", "score_home", "score_away",
+    "league_id", "league_name", "league_logo", "league_season", "league_round",
+    "home_team_logo", "away_team_logo",
+    "status_long", "status_short", "status_elapsed", "status_extra",
+)
+SCORE_HOME_IDX = MATCH_FIELDS.index("score_home")
+SCORE_AWAY_IDX = MATCH_FIELDS.index("score_away")
+MATCH_DATE_IDX = MATCH_FIELDS.index("match_date")
+# Columnas que forman la llave del partido en points_ledger (sin el usuario)
+LEDGER_KEY_IDXS = tuple(MATCH_FIELDS.index(field) for field in ("league_id", "league_season", "league_round"))
+UPSERT_CHUNK_SIZE = 1000
+
+def has_new_score(old_scores, score_home, score_away):
+    # Solo vale la pena recalcular si hay marcador y es distinto al guardado
+    if score_home is None or score_away is None:
+        return False
+    return old_scores != (score_home, score_away)
+
+def recalculate_points(db: Session, match_ids):
+    # Recalcula en proceso y en la misma transacción los partidos cuyo marcador cambió
+    summary = rescore_matches(db, match_ids)
+    print(f"[✔] Puntos recalculados: {summary['matches']} partidos, {summary['predictions']} pronósticos")
+    return summary
+
+def fixture_to_row(match):
+    # Convierte un fixture de API-Football en un dict con las columnas de Match
+    fixture = match["fixture"]
+    league = match["league"]
+    teams = match["teams"]
+    goals = match["goals"]
+    status = fixture["status"]
+
+    # La columna es naive en UTC; normalizar evita falsos cambios al comparar
+    match_date = datetime.fromisoformat(fixture["date"].replace("Z", "+00:00"))
+    match_date = match_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return {
+        "id": fixture["id"],
+        "home_team": teams["home"]["name"],
+        "away_team": teams["away"]["name"],
+        "match_date": match_date,
+        "score_home": goals["home"],
+        "score_away": goals["away"],
+        "league_id": league["id"],
+        "league_name": league["name"],
+        "league_logo": league["logo"],
+        "league_season": league["season"],
+        "league_round": league["round"],
+        "home_team_logo": teams["home"]["logo"],
+        "away_team_logo": teams["away"]["logo"],
+        "status_long": status.get("long"),
+        "status_short": status.get("short"),
+        "status_elapsed": status.get("elapsed"),
+        "status_extra": status.get("extra"),
+    }
 
-        all_fixtures.extend(data.get("response", []))
+def match_fingerprint(row):
+    return tuple(row[field] for field in MATCH_FIELDS)
 
-    return all_fixtures
-
-def trigger_points_recalculation(match_id, score_home, score_away, status_long, status_short, status_elapsed, status_extra):
-    url = f"{BACKEND_URL}/matches/{match_id}/result"
-    payload = {
-        "score_home": score_home,
-        "score_away": score_away,
-        "status_long": status_long,
-        "status_short": status_short,
-        "status_elapsed": status_elapsed,
-        "status_extra": status_extra
-    }
-    try:
-        response = requests.put(url, json=payload)
-        if response.status_code == 200:
-            print(f"[✔] Puntos recalculados para match {match_id}")
-        else:
-            print(f"[✘] Error recalculando puntos para match {match_id}: {response.status_code} {response.text}")
-    except Exception as e:
-        print(f"[✘] Fallo al conectar con el backend: {e}")
+def load_fingerprints(db: Session, match_ids):
+    # Una consulta por bloque de ids en lugar de un SELECT por partido
+    columns = [Match.id] + [getattr(Match, field) for field in MATCH_FIELDS]
+    fingerprints = {}
+    for i in range(0, len(match_ids), UPSERT_CHUNK_SIZE):
+        chunk = match_ids[i:i + UPSERT_CHUNK_SIZE]
+        for row in db.query(*columns).filter(Match.id.in_(chunk)):
+            fingerprints[row[0]] = tuple(row[1:])
+    return fingerprints
 
 def upsert_matches_to_db(fixtures, db: Session):
+    # Si un fixture viene repetido gana la última versión
+    rows = {}
     for match in fixtures:
-        fixture = match["fixture"]
-        league = match["league"]
-        teams = match["teams"]
-        goals = match["goals"]
-
-        match_id = fixture["id"]
-        match_date = datetime.fromisoformat(fixture["date"].replace("Z", "+00:00"))
-        score_home = goals["home"]
-        score_away = goals["away"]
-
-        # Nuevos campos
-        league_id = league["id"]
-        league_name = league["name"]
-        league_logo = league["logo"]
-        league_season = league["season"]
-        league_round = league["round"]
-        home_team = teams["home"]["name"]
-        away_team = teams["away"]["name"]
-        home_team_logo = teams["home"]["logo"]
-        away_team_logo = teams["away"]["logo"]
-
-        status = fixture["status"]
-        status_long = status.get("long")
-        status_short = status.get("short")
-        status_elapsed = status.get("elapsed")
-        status_extra = status.get("extra")
-
-        existing_match = db.query(Match).filter_by(id=match_id).first()
-
-        if existing_match:
-            existing_match.home_team = home_team
-            existing_match.away_team = away_team
-            existing_match.match_date = match_date
-            existing_match.score_home = score_home
-            existing_match.score_away = score_away
-            existing_match.league_id = league_id
-            existing_match.league_name = league_name
-            existing_match.league_logo = league_logo
-            existing_match.league_season = league_season
-            existing_match.league_round = league_round
-            existing_match.home_team_logo = home_team_logo
-            existing_match.away_team_logo = away_team_logo
-            existing_match.status_long = status_long
-            existing_match.status_short = status_short
-            existing_match.status_elapsed = status_elapsed
-            existing_match.status_extra = status_extra
+        row = fixture_to_row(match)
+        rows[row["id"]] = row
+
+    existing = load_fingerprints(db, list(rows))
+
+    to_insert, to_update, score_changed_ids, rescheduled = [], [], [], []
+    ledger_moves = {}
+    unchanged = 0
+    for match_id, row in rows.items():
+        fingerprint = match_fingerprint(row)
+        old = existing.get(match_id)
+        if old is None:
+            to_insert.append(row)
+        elif old == fingerprint:
+            unchanged += 1
+            continue
         else:
-            new_match = Match(
-                id=match_id,
-                home_team=home_team,
-                away_team=away_team,
-                match_date=match_date,
-                score_home=score_home,
-                score_away=score_away,
-                league_id=league_id,
-                league_name=league_name,
-                league_logo=league_logo,
-                league_season=league_season,
-                league_round=league_round,
-                home_team_logo=home_team_logo,
-                away_team_logo=away_team_logo,
-                status_long=status_long,
-                status_short=status_short,
-                status_elapsed=status_elapsed,
-                status_extra=status_extra
-            )
-            db.add(new_match)
+            to_update.append(row)
+
+        if old is None or old[MATCH_DATE_IDX] != row["match_date"]:
+            rescheduled.append((match_id, row["match_date"]))
+
+        if old is not None:
+            old_key = tuple(old[i] for i in LEDGER_KEY_IDXS)
+            new_key = tuple(fingerprint[i] for i in LEDGER_KEY_IDXS)
+            if old_key != new_key:
+                ledger_moves[match_id] = (old_key, new_key)
+
+        old_scores = None if old is None else (old[SCORE_HOME_IDX], old[SCORE_AWAY_IDX])
+        if has_new_score(old_scores, row["score_home"], row["score_away"]):
+            score_changed_ids.append(match_id)
+
+    if to_insert:
+        db.bulk_insert_mappings(Match, to_insert)
+    if to_update:
+        db.bulk_update_mappings(Match, to_update)
+    # Antes de recalcular: los deltas del recálculo ya caen en la llave nueva
+    moved_leagues = move_match_points(db, ledger_moves)
+    # Recordatorios T-24h / T-1h de partidos nuevos o con fecha nueva
+    schedule_match_reminders(db, rescheduled)
+
+    summary = {
+        "inserted": len(to_insert),
+        "updated": len(to_update),
+        "unchanged": unchanged,
+        "rescheduled": len(rescheduled),
+        "ledger_moves": len(ledger_moves),
+    }
+    print(f"[✔] Partidos: {summary['inserted']} nuevos, {summary['updated']} actualizados, {summary['unchanged']} sin cambios")
 
-        if score_home is not None and score_away is not None:
-            trigger_points_recalculation(match_id, score_home, score_away, status_long, status_short, status_elapsed, status_extra)
+    rescored = recalculate_points(db, score_changed_ids)
+    summary["rescored_matches"] = rescored["matches"]
+    summary["rescored_predictions"] = rescored["predictions"]
 
     db.commit()
+    ranking_cache.invalidate_leagues(rescored["leagues"] | moved_leagues)
+    return summary
+
+def sync_window(cursor, today):
+    # Si la última sincronización fue hace más días que la ventana, se
+    # retrocede hasta ella para no perder cambios intermedios
+    start = today - timedelta(days=SYNC_WINDOW_DAYS_BACK)
+    if cursor.last_synced_at is not None:
+        start = min(start, cursor.last_synced_at.date() - timedelta(days=1))
+    return start, today + timedelta(days=SYNC_WINDOW_DAYS_AHEAD)
+
+def unfinished_match_ids(db: Session, league_id, league_season, before):
+    # Partidos anteriores a la ventana que siguen sin marcarse como terminados
+    rows = db.query(Match.id).filter(
+        Match.league_id == league_id,
+        Match.league_season == league_season,
+        Match.match_date < before,
+        (Match.status_short.is_(None)) | (~Match.status_short.in_(FINISHED_STATUSES))
+    )
+    return [row.id for row in rows]
+
+def moved_out_match_ids(db: Session, league_id, league_season, start, end, received_ids):
+    # Partidos guardados dentro de la ventana que la API ya no regresó en ella:
+    # se reprogramaron fuera (más adelante) y hay que pedirlos por id para
+    # actualizar su fecha
+    rows = db.query(Match.id).filter(
+        Match.league_id == league_id,
+        Match.league_season == league_season,
+        Match.match_date >= start,
+        Match.match_date < end,
+        (Match.status_short.is_(None)) | (~Match.status_short.in_(FINISHED_STATUSES))
+    )
+    return [row.id for row in rows if row.id not in received_ids]
+
+def sync_fixtures(db: Session, full: bool = False):
+    # full=True (o una liga sin cursor) descarga la temporada completa;
+    # si no, solo la ventana de fechas de cada liga
+    client = get_client()
+    # Métricas solo de las llamadas de esta sincronización
+    call_stats = {}
+    now = datetime.utcnow()
+
+    league_entries = get_leagues_from_competitions(db)
+    cursors = {(c.league_id, c.league_season): c for c in db.query(FixtureSyncCursor)}
+
+    params_list, stale_ids, windows = [], [], {}
+    for league_id, season in league_entries:
+        cursor = cursors.get((league_id, season))
+        params = {"league": league_id, "season": season}
+        if not full and cursor is not None and cursor.last_full_sync_at is not None:
+            start, end = sync_window(cursor, now.date())
+            params["from"], params["to"] = start.isoformat(), end.isoformat()
+            windows[(league_id, season)] = (
+                datetime.combine(start, datetime.min.time()),
+                datetime.combine(end + timedelta(days=1), datetime.min.time()),
+            )
+            stale_ids.extend(unfinished_match_ids(db, league_id, season, datetime.combine(start, datetime.min.time())))
+        params_list.append(params)
+
+    fixtures, failed_leagues = [], 0
+    # Una sincronización completa pedida a mano no se conforma con la caché
+    moved_ids = []
+    for params, result in client.get_many("fixtures", params_list, refresh=full, call_stats=call_stats):
+        key = (params["league"], params["season"])
+        if isinstance(result, Exception):
+            # El cursor no avanza: la próxima corrida vuelve a cubrir estas fechas
+            print(f"Error al obtener fixtures de liga {key[0]} temporada {key[1]}:", result)
+            failed_leagues += 1
+            continue
+        fixtures.extend(result)
+        if key in windows:
+            received_ids = {match["fixture"]["id"] for match in result}
+            moved_ids.extend(moved_out_match_ids(db, key[0], key[1], *windows[key], received_ids))
+
+        cursor = cursors.get(key)
+        if cursor is None:
+            cursor = FixtureSyncCursor(league_id=key[0], league_season=key[1])
+            db.add(cursor)
+        cursor.last_synced_at = now
+        if "from" not in params:
+            cursor.last_full_sync_at = now
+
+    if stale_ids or moved_ids:
+        stale_fixtures, _ = client.fixtures_by_ids(stale_ids + moved_ids, call_stats=call_stats)
+        fixtures.extend(stale_fixtures)
+
+    summary = upsert_matches_to_db(fixtures, db)
+    summary.update({
+        "mode": "full" if full else "incremental",
+        "leagues": len(league_entries),
+        "full_leagues": sum(1 for params in params_list if "from" not in params),
+        "failed_leagues": failed_leagues,
+        "stale_lookups": len(stale_ids),
+        "moved_lookups": len(moved_ids),
+        "fixtures_received": len(fixtures),
+        "api_calls": call_stats.get("requests", 0),
+        "api_cache_hits": call_stats.get("cache_hits", 0),
+    })
+    print(
+        f"[✔] Sincronización {summary['mode']}: {summary['api_calls']} llamadas a la API "
+        f"({summary['api_cache_hits']} respondidas desde caché), "
+        f"{summary['fixtures_received']} fixtures recibidos, "
+        f"{summary['inserted'] + summary['updated']} filas escritas"
+    )
+    return summary
+
+# Columnas que cambian durante un partido
+LIVE_FIELDS = (
+    "score_home", "score_away",
+    "status_long", "status_short", "status_elapsed", "status_extra",
+)
+IN_PLAY_STATUSES = ("1H", "2H", "LIVE", "ET", "P", "BT", "HT", "INT")
+
+def fixture_to_live_row(match):
+    status = match["fixture"]["status"]
+    return {
+        "id": match["fixture"]["id"],
+        "score_home": match["goals"]["home"],
+        "score_away": match["goals"]["away"],
+        "status_long": status.get("long"),
+        "status_short": status.get("short"),
+        "status_elapsed": status.get("elapsed"),
+        "status_extra": status.get("extra"),
+    }
+
+def apply_live_updates(db: Session, fixtures):
+    # Marcador y estado de todos los fixtures en un solo lote: una consulta
+    # para leer lo guardado y un solo UPDATE para lo que cambió. Solo se
+    # reescriben filas con algún valor distinto y solo se recalculan puntos
+    # si cambiaron los goles (no por el minuto de juego).
+    rows = {}
+    for match in fixtures:
+        row = fixture_to_live_row(match)
+        rows[row["id"]] = row
+
+    columns = [Match.id] + [getattr(Match, field) for field in LIVE_FIELDS]
+    existing = {}
+    match_ids = list(rows)
+    for i in range(0, len(match_ids), UPSERT_CHUNK_SIZE):
+        chunk = match_ids[i:i + UPSERT_CHUNK_SIZE]
+        for row in db.query(*columns).filter(Match.id.in_(chunk)):
+            existing[row[0]] = tuple(row[1:])
+
+    to_update, score_changed_ids = [], []
+    for match_id, row in rows.items():
+        old = existing.get(match_id)
+        if old is None or old == tuple(row[field] for field in LIVE_FIELDS):
+            continue
+        to_update.append(row)
+        if has_new_score((old[0], old[1]), row["score_home"], row["score_away"]):
+            score_changed_ids.append(match_id)
+
+    write_live_rows(db, to_update)
+    return len(to_update), len(rows) - len(to_update), score_changed_ids
+
+def write_live_rows(db: Session, rows):
+    # Postgres: un solo UPDATE ... FROM (VALUES ...) por bloque en lugar de un
+    # UPDATE por fila. SQLite (benchmarks locales) no acepta la lista de
+    # columnas en el alias de VALUES, así que ahí se usa executemany.
+    if not rows:
+        return
+    if db.get_bind().dialect.name != "postgresql":
+        db.bulk_update_mappings(Match, rows)
+        return
+
+    table = Match.__table__
+    for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[i:i + UPSERT_CHUNK_SIZE]
+        incoming = values(
+            column("id", Integer),
+            *[column(field, table.c[field].type) for field in LIVE_FIELDS],
+            name="incoming"
+        ).data([(row["id"], *(row[field] for field in LIVE_FIELDS)) for row in chunk])
+        db.execute(
+            update(Match)
+            .where(Match.id == incoming.c.id)
+            # CAST: una columna que viene NULL en todo el bloque llega como text
+            .values({field: cast(incoming.c[field], table.c[field].type) for field in LIVE_FIELDS})
+            .execution_options(synchronize_session=False)
+        )
 
 def update_live_matches_from_api(db: Session):
     league_entries = get_leagues_from_competitions(db)
@@ -144,72 +343,40 @@ def update_live_matches_from_api(db: Session):
     league_ids_str = "-".join(league_ids)
 
     # Obtener partidos que aún están marcados como "en vivo"
-    in_play_matches = db.query(Match).filter(Match.status_short.in_([
-        "1H", "2H", "LIVE", "ET", "P", "BT", "HT", "INT"
-    ])).all()
-    in_play_ids = [m.id for m in in_play_matches]
-
-    url = f"{BASE_URL}/fixtures?live={league_ids_str}"
-    response = requests.get(url, headers=HEADERS)
-    data = response.json()
+    in_play_ids = [row.id for row in db.query(Match.id).filter(Match.status_short.in_(IN_PLAY_STATUSES))]
 
-    if response.status_code != 200:
-        print("❌ Error al obtener partidos en vivo:", data)
+    client = get_client()
+    try:
+        fixtures = client.get("fixtures", {"live": league_ids_str})
+    except FootballAPIError as e:
+        print("❌ Error al obtener partidos en vivo:", e)
         return
 
-    fixtures = data.get("response", [])
-    api_ids = [match["fixture"]["id"] for match in fixtures]
-
-    just_finished_ids = set(in_play_ids) - set(api_ids)
-
-    for match_id in just_finished_ids:
-        url = f"{BASE_URL}/fixtures?id={match_id}"
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            data = response.json().get("response", [])
-            if data:
-                match_data = data[0]
-                fixture = match_data["fixture"]
-                status = fixture["status"]
-
-                match = db.query(Match).filter_by(id=match_id).first()
-                if match:
-                    match.status_long = status.get("long")
-                    match.status_short = status.get("short")
-                    match.status_elapsed = status.get("elapsed")
-                    match.status_extra = status.get("extra")
-
-    for match in fixtures:
-        fixture = match["fixture"]
-        goals = match["goals"]
-
-        match_id = fixture["id"]
-        score_home = goals["home"]
-        score_away = goals["away"]
-
-        status = fixture["status"]
-        status_long = status.get("long")
-        status_short = status.get("short")
-        status_elapsed = status.get("elapsed")
-        status_extra = status.get("extra")
-
-        existing_match = db.query(Match).filter_by(id=match_id).first()
-
-        if existing_match:
-            existing_match.score_home = score_home
-            existing_match.score_away = score_away
-            existing_match.status_long = status_long
-            existing_match.status_short = status_short
-            existing_match.status_elapsed = status_elapsed
-            existing_match.status_extra = status_extra
-
-            if score_home is not None and score_away is not None:
-                trigger_points_recalculation(match_id, score_home, score_away, status_long, status_short, status_elapsed, status_extra)
-
+    # Los que salieron del feed en vivo ya terminaron (o se suspendieron):
+    # se consultan juntos con ids= en bloques de 20 para traer marcador final
+    api_ids = {match["fixture"]["id"] for match in fixtures}
+    just_finished_ids = sorted(set(in_play_ids) - api_ids)
+    if just_finished_ids:
+        finished_fixtures, failed_ids = client.fixtures_by_ids(just_finished_ids)
+        fixtures = fixtures + finished_fixtures
+        if failed_ids:
+            print(f"❌ No se pudieron consultar {len(failed_ids)} partidos terminados; se reintentará en la próxima corrida")
+
+    updated, skipped, score_changed_ids = apply_live_updates(db, fixtures)
+    summary = recalculate_points(db, score_changed_ids)
     db.commit()
+    ranking_cache.invalidate_leagues(summary["leagues"])
+    summary["written"] = updated
+    summary["skipped"] = skipped
+    summary["just_finished"] = len(just_finished_ids)
+    print(
+        f"[✔] En vivo: {updated} filas escritas, {skipped} sin cambios, "
+        f"{len(score_changed_ids)} con goles nuevos, {len(just_finished_ids)} recién terminados"
+    )
+    return summary
 
 if __name__ == "__main__":
-    fixtures = get_fixtures()
+    # python update_matches.py [--full]
     db = next(get_db())
-    upsert_matches_to_db(fixtures, db)
+    sync_fixtures(db, full="--full" in sys.argv)
     print("Actualización completa.")
\ No newline at end of file
@@ -1,6 +1,119 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException # type: ignore
 from passlib.context import CryptContext # type: ignore
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt corre en un pool de procesos dedicado y acotado para que una ráfaga de
+# logins no acapare el threadpool de FastAPI. Si ya hay demasiados hashes en
+# curso se responde 503 de inmediato en vez de encolar sin límite.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # 0 = en el mismo proceso
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 4)))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "0"))
+
+# min/max iguales a los rounds configurados: un hash con otro costo se
+# considera desactualizado y se vuelve a generar en el siguiente login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+hash_pool_stats = {"completed": 0, "rejected": 0, "rehashed": 0, "pool_restarts": 0}
+_stats_lock = threading.Lock()
+
+
+def count(stat):
+    with _stats_lock:
+        hash_pool_stats[stat] += 1
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str):
+    return pwd_context.verify_and_update(password, hashed)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: el servidor ya tiene hilos y hacer fork de un proceso con hilos no es seguro
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _discard_executor(broken):
+    # Un worker muerto (OOM, crash) deja el pool inservible para siempre; se
+    # descarta para que el siguiente _get_executor cree uno nuevo. Solo si
+    # sigue siendo el roto: otro hilo pudo haberlo reemplazado ya.
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+            broken.shutdown(wait=False, cancel_futures=True)
+            count("pool_restarts")
+
+
+def _submit(fn, *args):
+    executor = _get_executor()
+    try:
+        return executor.submit(fn, *args).result()
+    except BrokenProcessPool:
+        _discard_executor(executor)
+    # Un reintento con un pool nuevo; si vuelve a fallar, 503
+    executor = _get_executor()
+    try:
+        return executor.submit(fn, *args).result()
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "1"}
+        )
+
+
+def _run(fn, *args):
+    if PASSWORD_HASH_QUEUE_TIMEOUT > 0:
+        admitted = _pending.acquire(timeout=PASSWORD_HASH_QUEUE_TIMEOUT)
+    else:
+        admitted = _pending.acquire(blocking=False)
+    if not admitted:
+        count("rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        if PASSWORD_HASH_WORKERS <= 0:
+            result = fn(*args)
+        else:
+            result = _submit(fn, *args)
+        count("completed")
+        return result
+    finally:
+        _pending.release()
+
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
\ No newline at end of file
+    return _run(_hash, password)
+
+
+def verify_password(password: str, hashed: str):
+    # Regresa (válida, nuevo_hash); nuevo_hash no es None si el costo cambió
+    return _run(_verify_and_update, password, hashed)